@@ -5,9 +5,13 @@
 from repeated_test.core import Fixtures, WithTestClass
 from repeated_test.utils import tup, options, with_options, with_options_matrix, skip_option, NamedAlternative
 from repeated_test._evaluated import evaluated
+from repeated_test._lazy import lazy
+from repeated_test._blob import blob
+from repeated_test._explore import explore
+from repeated_test._abort import AbortPolicy
 
 __all__ = [
     'Fixtures', 'WithTestClass', 'tup',
     "options", "with_options", "with_options_matrix", "skip_option", "NamedAlternative",
-    "evaluated",
+    "evaluated", "lazy", "blob", "explore", "AbortPolicy",
     ]
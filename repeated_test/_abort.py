@@ -0,0 +1,162 @@
+# repeated_test -- A framework for repeating a test over many values
+# Copyright (C) 2011-2022 by Yann Kaiser and contributors. See AUTHORS and
+# COPYING for details.
+
+import contextlib
+import os
+import threading
+import unittest
+import weakref
+
+
+ABORT_ENV = 'REPEATED_TEST_ABORT'
+SCOPES = ('fixture', 'class')
+
+
+class AbortPolicy:
+    """Stops running combinations once too many of them failed
+
+    ``max_failures`` stops after that many failures. ``max_failure_rate``
+    stops once the proportion of failed combinations goes above it, after at
+    least ``min_runs`` combinations ran. With ``scope="class"``, failures are
+    counted across all the fixtures of the class rather than for each fixture.
+    """
+
+    def __init__(self, max_failures=None, *, max_failure_rate=None,
+                 min_runs=10, scope='fixture'):
+        if scope not in SCOPES:
+            raise ValueError(
+                f"scope must be one of {', '.join(SCOPES)}, not {scope!r}")
+        self.max_failures = max_failures
+        self.max_failure_rate = max_failure_rate
+        self.min_runs = min_runs
+        self.scope = scope
+
+    @classmethod
+    def parse(cls, text):
+        """Reads a policy written as ``3`` or ``max_failures=3,scope=class``"""
+        text = text.strip()
+        if text.isdigit():
+            return cls(int(text))
+        kwargs = {}
+        for part in filter(None, text.split(',')):
+            key, sep, value = (s.strip() for s in part.partition('='))
+            if not sep:
+                raise ValueError(f"Invalid abort policy: {text!r}")
+            if key in ('max_failures', 'min_runs'):
+                kwargs[key] = int(value)
+            elif key == 'max_failure_rate':
+                kwargs[key] = float(value)
+            elif key == 'scope':
+                kwargs[key] = value
+            else:
+                raise ValueError(f"Unknown abort policy setting: {key!r}")
+        return cls(**kwargs)
+
+    def _key(self):
+        return self.max_failures, self.max_failure_rate, self.min_runs, self.scope
+
+    def __eq__(self, other):
+        if not isinstance(other, AbortPolicy):
+            return NotImplemented
+        return self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def __repr__(self):
+        defaults = AbortPolicy()._key()
+        names = 'max_failures', 'max_failure_rate', 'min_runs', 'scope'
+        args = ', '.join(
+            f'{name}={value!r}'
+            for name, value, default in zip(names, self._key(), defaults)
+            if value != default
+        )
+        return f'AbortPolicy({args})'
+
+    def exceeded(self, runs, failures):
+        if self.max_failures is not None and failures >= self.max_failures:
+            return True
+        return (
+            self.max_failure_rate is not None
+            and runs >= self.min_runs
+            and failures > self.max_failure_rate * runs
+        )
+
+
+class AbortState:
+    def __init__(self, policy):
+        self.policy = policy
+        self.runs = 0
+        self.failures = 0
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def recording(self):
+        try:
+            yield
+        except unittest.SkipTest:
+            raise
+        except BaseException:
+            with self.lock:
+                self.runs += 1
+                self.failures += 1
+            raise
+        else:
+            with self.lock:
+                self.runs += 1
+
+    def should_abort(self):
+        with self.lock:
+            return self.policy.exceeded(self.runs, self.failures)
+
+    def summary(self, not_run, count):
+        return (
+            f"Aborted after {self.failures} failures in {self.runs} runs "
+            f"({self.policy!r}): {len(not_run)} of {count} combinations "
+            f"not run: {describe_indexes(not_run)}"
+        )
+
+
+def describe_indexes(indexes, limit=8):
+    """Compacts sorted indexes into ranges, as in ``3-9, 12``"""
+    ranges = []
+    for index in indexes:
+        if ranges and ranges[-1][1] == index - 1:
+            ranges[-1][1] = index
+        else:
+            ranges.append([index, index])
+    parts = [
+        str(start) if start == end else f'{start}-{end}'
+        for start, end in ranges[:limit]
+    ]
+    if len(ranges) > limit:
+        parts.append('...')
+    return ', '.join(parts)
+
+
+_class_states = weakref.WeakKeyDictionary()
+_class_states_lock = threading.Lock()
+
+
+def policy_for(test_case, environ=os.environ):
+    """The policy set for this run, or else the test class's ``_abort_policy``"""
+    text = environ.get(ABORT_ENV)
+    if text:
+        return AbortPolicy.parse(text)
+    return getattr(test_case, '_abort_policy', None) or AbortPolicy()
+
+
+def state_for(test_case):
+    policy = policy_for(test_case)
+    if policy.scope == 'fixture':
+        return AbortState(policy)
+    cls = type(test_case)
+    with _class_states_lock:
+        state = _class_states.get(cls)
+        if state is None or state.policy != policy:
+            state = _class_states[cls] = AbortState(policy)
+            add_class_cleanup = getattr(cls, 'addClassCleanup', None)
+            if add_class_cleanup is not None:
+                add_class_cleanup(_class_states.pop, cls, None)
+    return state
@@ -0,0 +1,160 @@
+# repeated_test -- A framework for repeating a test over many values
+# Copyright (C) 2011-2022 by Yann Kaiser and contributors. See AUTHORS and
+# COPYING for details.
+
+import collections
+import contextlib
+import mmap
+import os
+import sys
+import threading
+
+
+__unittest = True # hides frames from this file from unittest output
+
+
+DEFAULT_MAX_IDLE = 16
+
+
+def blob(path):
+    """Refers to a file, whose contents are passed to the ``_test`` function
+    as a read-only ``memoryview``
+
+    Relative paths are relative to the directory of the file calling blob.
+    """
+    base = os.path.dirname(os.path.abspath(sys._getframe(1).f_code.co_filename))
+    return Blob(path, base)
+
+
+class Blob:
+    def __init__(self, path, base=None):
+        self.path = path
+        self.full_path = os.path.join(base or os.getcwd(), path)
+
+    def opened(self, registry=None):
+        """Context manager that maps the file's contents"""
+        return (registry or _registry).opened(self.full_path)
+
+    def __eq__(self, other):
+        if not isinstance(other, Blob):
+            return NotImplemented
+        return self.full_path == other.full_path
+
+    def __hash__(self):
+        return hash((Blob, self.full_path))
+
+    def __repr__(self):
+        return f'repeated_test.blob({self.path!r})'
+
+
+class _Mapping:
+    def __init__(self, f, size):
+        self.refs = 0
+        if size:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.view = memoryview(self.mmap)
+        else:
+            # Empty files can't be mapped
+            self.mmap = None
+            self.view = memoryview(b'')
+
+    def close(self):
+        try:
+            self.view.release()
+            if self.mmap is not None:
+                self.mmap.close()
+        except BufferError:
+            # Something still uses the contents, such as a slice kept by the
+            # test. The mapping is closed once that is garbage collected.
+            pass
+
+
+class MappingRegistry:
+    """Maps files in memory, sharing each mapping while it is in use
+
+    A file is mapped once for everything using it at the same time, and the
+    operating system shares the mapped pages between processes. Mappings are
+    counted as they are opened and closed, and unused ones are kept for reuse,
+    up to ``max_idle`` of them, after which the least recently used one is
+    unmapped.
+
+    Files are told apart by their device, inode, size and modification time,
+    so that a file changed on disk is mapped anew.
+    """
+
+    def __init__(self, max_idle=DEFAULT_MAX_IDLE):
+        self.max_idle = max_idle
+        self._mappings = {}
+        self._idle = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _acquire(self, path):
+        with open(path, 'rb') as f:
+            st = os.fstat(f.fileno())
+            key = st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns
+            with self._lock:
+                mapping = self._mappings.get(key)
+                if mapping is None:
+                    mapping = self._mappings[key] = _Mapping(f, st.st_size)
+                mapping.refs += 1
+                self._idle.pop(key, None)
+        return key, mapping
+
+    def _release(self, key, mapping):
+        evicted = []
+        with self._lock:
+            mapping.refs -= 1
+            if mapping.refs == 0:
+                self._idle[key] = mapping
+                evicted = self._evict(self.max_idle)
+        for mapping in evicted:
+            mapping.close()
+
+    def _evict(self, max_idle):
+        evicted = []
+        while len(self._idle) > max_idle:
+            key, mapping = self._idle.popitem(last=False)
+            del self._mappings[key]
+            evicted.append(mapping)
+        return evicted
+
+    @contextlib.contextmanager
+    def opened(self, path):
+        key, mapping = self._acquire(path)
+        try:
+            yield mapping.view
+        finally:
+            self._release(key, mapping)
+
+    def mapped_count(self):
+        """The number of files currently mapped"""
+        with self._lock:
+            return len(self._mappings)
+
+    def close(self):
+        """Unmaps the files that aren't in use"""
+        with self._lock:
+            evicted = self._evict(0)
+        for mapping in evicted:
+            mapping.close()
+
+
+_registry = MappingRegistry()
+
+
+@contextlib.contextmanager
+def opened(args, *kwargs_dicts):
+    """Replaces blobs in args and in the given keyword argument dicts with
+    views of their contents, for as long as the context lasts"""
+    with contextlib.ExitStack() as stack:
+        def open_value(value):
+            if isinstance(value, Blob):
+                return stack.enter_context(value.opened())
+            return value
+        yield (
+            [open_value(arg) for arg in args],
+            *(
+                {key: open_value(value) for key, value in kwargs.items()}
+                for kwargs in kwargs_dicts
+            ),
+        )
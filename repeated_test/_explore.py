@@ -0,0 +1,152 @@
+# repeated_test -- A framework for repeating a test over many values
+# Copyright (C) 2011-2022 by Yann Kaiser and contributors. See AUTHORS and
+# COPYING for details.
+
+import collections.abc
+import itertools
+import os
+import random
+
+from repeated_test import _matrix
+
+
+__unittest = True # hides frames from this file from unittest output
+
+
+SEED_ENV = 'REPEATED_TEST_EXPLORE_SEED'
+BUDGET_ENV = 'REPEATED_TEST_EXPLORE_BUDGET'
+
+DEFAULT_BUDGET = 100
+
+
+def explore(values):
+    """Marks an options matrix axis whose values are sampled rather than all
+    run, such as ``explore(range(1, 2**20))``
+
+    Earlier values are considered simpler: failures are shrunk towards them.
+    """
+    return Explore(values)
+
+
+class Explore(collections.abc.Sequence):
+    def __init__(self, values):
+        if not isinstance(values, collections.abc.Sequence):
+            values = tuple(values)
+        self.values = values
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, index):
+        return self.values[index]
+
+    def __repr__(self):
+        return f'repeated_test.explore({self.values!r})'
+
+
+def is_explored(axes):
+    return any(isinstance(values, Explore) for _, values in axes)
+
+
+def budget_for(test_case, environ=os.environ):
+    budget = environ.get(BUDGET_ENV)
+    if budget:
+        return int(budget)
+    return getattr(test_case, '_explore_budget', DEFAULT_BUDGET)
+
+
+def random_for(test_case, environ=os.environ):
+    """A random generator that is the same for each run of a test, unless
+    ``REPEATED_TEST_EXPLORE_SEED`` or ``_explore_seed`` changes"""
+    seed = environ.get(SEED_ENV) or getattr(test_case, '_explore_seed', 0)
+    return random.Random(f'{seed}:{test_case.id()}')
+
+
+def _edge_digits(values):
+    if not isinstance(values, Explore):
+        return range(len(values))
+    size = len(values)
+    return sorted({
+        digit for digit in (0, 1, size // 2, size - 2, size - 1)
+        if 0 <= digit < size
+    })
+
+
+def _candidates(axes, rng):
+    """Yields digits to try: the edges of explored axes with every value of
+    the others, then random combinations"""
+    edges = itertools.product(*(_edge_digits(values) for _, values in axes))
+    while True:
+        digits = next(edges, None)
+        if digits is not None:
+            yield digits
+        yield tuple(rng.randrange(len(values)) for _, values in axes)
+
+
+class Search:
+    """Looks for a failing combination within a budget of runs, then shrinks
+    it by moving each axis towards its first value while the test still fails,
+    within the same budget again
+
+    ``run`` takes a combination index and returns a
+    ``parallel.CapturedTest``.
+    """
+
+    def __init__(self, axes, budget, rng, run):
+        self.axes = axes
+        self.budget = budget
+        self.rng = rng
+        self.run = run
+        self.runs = 0
+        self.failures = {}
+        self.tried = set()
+
+    def _fails(self, digits):
+        index = _matrix.combination_index(self.axes, digits)
+        self.tried.add(index)
+        self.runs += 1
+        captured = self.run(index)
+        if not captured.failed:
+            return False
+        self.failures[index] = captured
+        return True
+
+    def _find(self):
+        # Random combinations can repeat, so give up after a few in a row
+        repeats = 0
+        for digits in _candidates(self.axes, self.rng):
+            if self.runs >= self.budget or repeats > self.budget:
+                return None
+            if _matrix.combination_index(self.axes, digits) in self.tried:
+                repeats += 1
+                continue
+            repeats = 0
+            if self._fails(digits):
+                return list(digits)
+
+    def _shrink(self, digits):
+        limit = self.runs + self.budget
+        shrunk = True
+        while shrunk:
+            shrunk = False
+            for axis in range(len(digits)):
+                low, high = 0, digits[axis]
+                while low < high and self.runs < limit:
+                    candidate = list(digits)
+                    candidate[axis] = (low + high) // 2
+                    index = _matrix.combination_index(self.axes, candidate)
+                    if index in self.failures or (
+                            index not in self.tried and self._fails(candidate)):
+                        digits, high, shrunk = candidate, candidate[axis], True
+                    else:
+                        low = candidate[axis] + 1
+        return digits
+
+    def search(self):
+        """Returns the index of the smallest failing combination found, and
+        its ``CapturedTest`` outcome, or None"""
+        digits = self._find()
+        if digits is None:
+            return None
+        index = _matrix.combination_index(self.axes, self._shrink(digits))
+        return index, self.failures[index]
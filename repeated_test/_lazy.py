@@ -0,0 +1,56 @@
+import threading
+import weakref
+
+
+__unittest = True # hides frames from this file from unittest output
+
+
+def lazy(func):
+    """Marks func as to-be-called when its fixture's test runs, to obtain (part of) the fixture's tuple"""
+    return Lazy(func)
+
+
+class _Values:
+    # Tuples can't be weakly referenced, so wrap them
+    __slots__ = ('values', '__weakref__')
+
+    def __init__(self, values):
+        self.values = tuple(values)
+
+
+class Lazy:
+    def __init__(self, func):
+        self.func = func
+        self._ref = None
+        self._lock = threading.Lock()
+
+    def resolve(self):
+        """Returns a holder for the values produced by func, reusing it while
+        it is still referenced elsewhere"""
+        with self._lock:
+            values = self._ref() if self._ref is not None else None
+            if values is None:
+                values = _Values(self.func())
+                self._ref = weakref.ref(values)
+            return values
+
+    def __repr__(self):
+        return f'repeated_test.lazy({self.func!r})'
+
+
+def resolve_items(items):
+    """Splices the values of lazy items into items
+
+    Also returns the objects that keep these values cached, for the caller
+    to hold on to while it uses them.
+    """
+    keepalive = []
+    result = []
+    for item in items:
+        if isinstance(item, Lazy):
+            holder = item.resolve()
+            keepalive.append(holder)
+            result.extend(holder.values)
+        else:
+            result.append(item)
+    return tuple(result), keepalive
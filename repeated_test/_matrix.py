@@ -0,0 +1,138 @@
+# repeated_test -- A framework for repeating a test over many values
+# Copyright (C) 2011-2022 by Yann Kaiser and contributors. See AUTHORS and
+# COPYING for details.
+
+import collections.abc
+import os
+import re
+
+
+SELECT_ENV = 'REPEATED_TEST_SELECT'
+
+selected_name_re = re.compile(r'^(test_[^\[\]]+)\[([^\[\]]*)\]$')
+_environ_entry_re = re.compile(r'^([^\[\]]+)\[([^\[\]]*)\]$')
+
+
+def materialized(matrix):
+    """Turns the values of an options matrix into sequences, once, so that
+    generators can be read by every fixture
+
+    Values are kept as-is when they are sequences so that large ranges
+    aren't materialized.
+    """
+    return {
+        key: values if isinstance(values, collections.abc.Sequence)
+             else tuple(values)
+        for key, values in matrix.items()
+    }
+
+
+def matrix_axes(matrix, kwargs):
+    """Lists the (key, values) pairs that vary for a fixture
+
+    Keys already given as options by the fixture don't vary.
+    """
+    return [
+        (key, values)
+        for key, values in matrix.items()
+        if key not in kwargs
+    ]
+
+
+def combination_count(axes):
+    count = 1
+    for _, values in axes:
+        count *= len(values)
+    return count
+
+
+def combination_at(axes, index):
+    """Decodes an index into the combination with that position in
+    ``itertools.product`` order, where the last axis varies fastest"""
+    digits = []
+    for _, values in reversed(axes):
+        index, digit = divmod(index, len(values))
+        digits.append(digit)
+    digits.reverse()
+    return {
+        key: values[digit]
+        for (key, values), digit in zip(axes, digits)
+    }
+
+
+def combination_index(axes, digits):
+    index = 0
+    for (_, values), digit in zip(axes, digits):
+        index = index * len(values) + digit
+    return index
+
+
+def _value_matches(value, text):
+    return text == str(value) or text == repr(value)
+
+
+def _select_digits(key, values, text):
+    digits = [
+        digit for digit, value in enumerate(values)
+        if _value_matches(value, text)
+    ]
+    if not digits:
+        raise ValueError(f"No value for option {key!r} matches {text!r}")
+    return digits
+
+
+def select_indexes(axes, selector):
+    """Lists the combination indexes picked by a selector
+
+    The selector is either an index, or comma-separated ``key=value`` pairs
+    where ``value`` is compared to the ``str()`` and ``repr()`` of the
+    option's values. Options that aren't mentioned keep all their values.
+    """
+    count = combination_count(axes)
+    selector = selector.strip()
+    if selector.isdigit():
+        index = int(selector)
+        if index >= count:
+            raise ValueError(
+                f"Combination index {index} out of range, "
+                f"there are {count} combinations")
+        return [index]
+    wanted = {}
+    for part in filter(None, selector.split(',')):
+        key, sep, text = part.partition('=')
+        if not sep:
+            raise ValueError(f"Invalid combination selector: {part!r}")
+        wanted[key.strip()] = text.strip()
+    unknown = set(wanted) - {key for key, _ in axes}
+    if unknown:
+        raise ValueError(
+            "Unknown options in combination selector: "
+            + ', '.join(sorted(unknown)))
+    indexes = [0]
+    for key, values in axes:
+        if key in wanted:
+            digits = _select_digits(key, values, wanted[key])
+        else:
+            digits = range(len(values))
+        indexes = [
+            index * len(values) + digit
+            for index in indexes
+            for digit in digits
+        ]
+    return indexes
+
+
+def selector_from_environ(test_id, environ=os.environ):
+    """Finds the selector ``REPEATED_TEST_SELECT`` gives for a test
+
+    The variable holds whitespace-separated ``name[selector]`` entries, where
+    ``name`` is the test method's name or a dotted suffix of the test id.
+    """
+    for entry in environ.get(SELECT_ENV, '').split():
+        match = _environ_entry_re.match(entry)
+        if match is None:
+            raise ValueError(f"Invalid {SELECT_ENV} entry: {entry!r}")
+        target = match.group(1)
+        if test_id == target or test_id.endswith('.' + target):
+            return match.group(2)
+    return None
@@ -0,0 +1,86 @@
+# repeated_test -- A framework for repeating a test over many values
+# Copyright (C) 2011-2022 by Yann Kaiser and contributors. See AUTHORS and
+# COPYING for details.
+
+import contextlib
+import json
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+    import msvcrt
+
+
+_unset = object()
+
+_excluded_dirs = {'site-packages', 'dist-packages'}
+
+
+class Active:
+    """An object set up for the whole process the first time it is needed,
+    usually from environment variables
+
+    ``setup`` returns the object, or None when the feature isn't enabled.
+    """
+
+    def __init__(self, setup):
+        self.setup = setup
+        self.value = _unset
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self.value is _unset:
+            with self._lock:
+                if self.value is _unset:
+                    self.value = self.setup()
+        return self.value
+
+
+def write_json(path, data, **kwargs):
+    """Writes data to path as JSON, replacing the file all at once so that
+    other processes never read it half-written"""
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, sort_keys=True, **kwargs)
+    os.replace(tmp_path, path)
+
+
+@contextlib.contextmanager
+def locked(path):
+    """Keeps other processes from entering ``locked(path)`` until the block
+    is done, so that they can read, update and write path in turn"""
+    with open(f'{path}.lock', 'a+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    # Gives up after about 10 seconds
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def project_file(filename, root):
+    """Returns the real path of filename if it is under root and not part of
+    an installed package, or None"""
+    path = os.path.realpath(filename)
+    if (
+        not path.startswith(os.path.realpath(root) + os.sep)
+        or set(path.split(os.sep)) & _excluded_dirs
+    ):
+        return None
+    return path
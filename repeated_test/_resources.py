@@ -0,0 +1,195 @@
+# repeated_test -- A framework for repeating a test over many values
+# Copyright (C) 2011-2022 by Yann Kaiser and contributors. See AUTHORS and
+# COPYING for details.
+
+import collections
+import contextlib
+import inspect
+import threading
+import weakref
+
+
+__unittest = True # hides frames from this file from unittest output
+
+
+DEFAULT_POOL_SIZE = 8
+
+
+def _parameter_names(func):
+    try:
+        parameters = inspect.signature(func).parameters.values()
+    except (TypeError, ValueError):
+        return None
+    names = set()
+    for parameter in parameters:
+        if parameter.kind == parameter.VAR_KEYWORD:
+            return None
+        if parameter.kind in (parameter.POSITIONAL_OR_KEYWORD, parameter.KEYWORD_ONLY):
+            names.add(parameter.name)
+    return names
+
+
+def _is_hashable(value):
+    try:
+        hash(value)
+    except TypeError:
+        return False
+    return True
+
+
+class _Entry:
+    def __init__(self, factory, kwargs):
+        result = factory(**kwargs)
+        if inspect.isgenerator(result):
+            self.generator = result
+            self.resource = next(result)
+        else:
+            self.generator = None
+            self.resource = result
+
+    def teardown(self):
+        if self.generator is None:
+            return
+        try:
+            next(self.generator)
+        except StopIteration:
+            pass
+        else:
+            raise RuntimeError("Resource factory yielded more than once")
+
+
+class ResourcePool:
+    """Keeps resources around for reuse, keyed by the options they depend on
+
+    Each checkout gets exclusive use of a resource. Returned resources are
+    kept idle for later checkouts, up to ``maxsize`` of them, after which the
+    least recently used one is torn down. Resources that depend on unhashable
+    values are torn down as soon as they are returned.
+    """
+
+    def __init__(self, maxsize=DEFAULT_POOL_SIZE):
+        self.maxsize = maxsize
+        self._idle = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._dependencies = {}
+
+    def _key(self, name, factory, kwargs):
+        try:
+            dependencies = self._dependencies[factory]
+        except KeyError:
+            dependencies = self._dependencies[factory] = _parameter_names(factory)
+        if dependencies is None:
+            dependencies = kwargs.keys()
+        values = {
+            key: value for key, value in kwargs.items()
+            if key in dependencies
+        }
+        if not all(_is_hashable(value) for value in values.values()):
+            # Values such as those made by evaluated or lazy functions may not
+            # outlive the test, so their identity can't tell them apart
+            return None, values
+        return (name, tuple(sorted(values.items()))), values
+
+    @contextlib.contextmanager
+    def checkout(self, name, factory, kwargs):
+        key, factory_kwargs = self._key(name, factory, kwargs)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Resource pool is closed")
+            entries = self._idle.get(key) if key is not None else None
+            entry = entries.pop() if entries else None
+            if entries == []:
+                del self._idle[key]
+        if entry is None:
+            entry = _Entry(factory, factory_kwargs)
+        try:
+            yield entry.resource
+        finally:
+            self._checkin(key, entry)
+
+    def _checkin(self, key, entry):
+        evicted = []
+        with self._lock:
+            if self._closed or key is None:
+                evicted.append(entry)
+            else:
+                self._idle.setdefault(key, []).append(entry)
+                self._idle.move_to_end(key)
+                evicted = self._evict(self.maxsize)
+        self._teardown(evicted)
+
+    def _evict(self, maxsize):
+        evicted = []
+        idle_count = sum(len(entries) for entries in self._idle.values())
+        while idle_count > maxsize:
+            key, entries = next(iter(self._idle.items()))
+            evicted.append(entries.pop(0))
+            if not entries:
+                del self._idle[key]
+            idle_count -= 1
+        return evicted
+
+    def _teardown(self, entries):
+        errors = []
+        for entry in entries:
+            try:
+                entry.teardown()
+            except Exception as exc:
+                errors.append(exc)
+        if errors:
+            raise errors[0]
+
+    def close(self):
+        """Tears down idle resources, and checked out ones once returned"""
+        with self._lock:
+            self._closed = True
+            evicted = self._evict(0)
+        self._teardown(evicted)
+
+
+_pools = weakref.WeakKeyDictionary()
+_pools_lock = threading.Lock()
+
+
+def _remove_pool(cls):
+    pool, _ = _pools.pop(cls, (None, None))
+    if pool is not None:
+        pool.close()
+
+
+def _class_pool(cls):
+    with _pools_lock:
+        try:
+            return _pools[cls]
+        except KeyError:
+            pass
+        accepted = _parameter_names(cls._test)
+        factories = {
+            name: factory for name, factory in cls._resources.items()
+            if accepted is None or name in accepted
+        }
+        pool = ResourcePool(getattr(cls, '_resource_pool_size', DEFAULT_POOL_SIZE))
+        _pools[cls] = pool, factories
+        add_class_cleanup = getattr(cls, 'addClassCleanup', None)
+        if add_class_cleanup is not None:
+            add_class_cleanup(_remove_pool, cls)
+        else:
+            weakref.finalize(cls, pool.close)
+        return pool, factories
+
+
+@contextlib.contextmanager
+def checkout_resources(test_case, kwargs):
+    """Checks out the resources the test function takes and that no option
+    already provides"""
+    if not getattr(test_case, '_resources', None):
+        yield {}
+        return
+    pool, factories = _class_pool(type(test_case))
+    with contextlib.ExitStack() as stack:
+        yield {
+            name: stack.enter_context(pool.checkout(name, factory, kwargs))
+            for name, factory in factories.items()
+            if name not in kwargs
+        }
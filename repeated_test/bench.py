@@ -0,0 +1,227 @@
+# repeated_test -- A framework for repeating a test over many values
+# Copyright (C) 2011-2022 by Yann Kaiser and contributors. See AUTHORS and
+# COPYING for details.
+
+"""Benchmarking the combinations of ``Fixtures`` classes.
+
+With ``REPEATED_TEST_BENCH=results.json``, each combination is timed instead
+of being run once: the test function (or ``_bench``, if the class defines
+one) is called a few times to warm up, then in loops long enough to be timed
+reliably, for a number of samples. Timings are saved at exit.
+
+With ``REPEATED_TEST_BENCH_BASELINE=baseline.json``, combinations whose
+fastest sample is slower than the baseline's by more than the threshold
+(``REPEATED_TEST_BENCH_THRESHOLD``, or ``_bench_threshold``, 0.1 by default)
+fail.
+
+``python -m repeated_test.bench`` shows results and compares them.
+"""
+
+import argparse
+import atexit
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+
+from repeated_test import _process
+
+
+BENCH_ENV = 'REPEATED_TEST_BENCH'
+BASELINE_ENV = 'REPEATED_TEST_BENCH_BASELINE'
+THRESHOLD_ENV = 'REPEATED_TEST_BENCH_THRESHOLD'
+
+RESULTS_VERSION = 1
+
+DEFAULT_WARMUP = 1
+DEFAULT_MIN_TIME = 0.01
+DEFAULT_REPEAT = 5
+DEFAULT_THRESHOLD = 0.1
+
+
+def function_for(test_case):
+    """The function benchmarked for a test case: ``_bench``, or ``_test``"""
+    return getattr(test_case, '_bench', None) or test_case._test
+
+
+def _time_loops(call, loops, timer=time.perf_counter):
+    start = timer()
+    for _ in range(loops):
+        call()
+    return timer() - start
+
+
+def measure(call, *, warmup=DEFAULT_WARMUP, min_time=DEFAULT_MIN_TIME,
+            repeat=DEFAULT_REPEAT):
+    """Times ``call``, returning a dict with the time per call in seconds"""
+    for _ in range(warmup):
+        call()
+    loops = 1
+    while True:
+        elapsed = _time_loops(call, loops)
+        if elapsed >= min_time:
+            break
+        if elapsed <= 0:
+            loops *= 10
+        else:
+            loops = max(loops + 1, int(loops * min(10, 1.2 * min_time / elapsed)))
+    samples = [elapsed / loops] + [
+        _time_loops(call, loops) / loops
+        for _ in range(repeat - 1)
+    ]
+    return {
+        'loops': loops,
+        'samples': samples,
+        'mean': statistics.mean(samples),
+        'stdev': statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        'min': min(samples),
+    }
+
+
+def load_results(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            results = json.load(f)
+    except FileNotFoundError:
+        return {}
+    if results.get('version') != RESULTS_VERSION:
+        raise ValueError(f"Unsupported benchmark results file: {path}")
+    return results['results']
+
+
+def save_results(path, results):
+    _process.write_json(
+        path, {'version': RESULTS_VERSION, 'results': results}, indent=1)
+
+
+def compare(baseline, results, threshold=DEFAULT_THRESHOLD, stat='min'):
+    """Lists ``(test_id, cell, baseline, current, ratio, regressed)`` for
+    each cell present in both results"""
+    rows = []
+    for test_id, cells in sorted(results.items()):
+        for cell, result in sorted(cells.items(), key=lambda item: int(item[0])):
+            base = baseline.get(test_id, {}).get(cell)
+            if base is None or base['params'] != result['params']:
+                continue
+            ratio = result[stat] / base[stat] if base[stat] else float('inf')
+            rows.append((test_id, cell, base[stat], result[stat], ratio,
+                         ratio > 1 + threshold))
+    return rows
+
+
+class Benchmark:
+    """Times combinations and collects their results"""
+
+    def __init__(self, path, baseline=None, threshold=None):
+        self.path = path
+        self.baseline = baseline or {}
+        self.threshold = threshold
+        self.results = {}
+        self.lock = threading.Lock()
+
+    def measure_for(self, test_case, index, combination):
+        def measure_call(call):
+            result = measure(
+                call,
+                warmup=getattr(test_case, '_bench_warmup', DEFAULT_WARMUP),
+                min_time=getattr(test_case, '_bench_min_time', DEFAULT_MIN_TIME),
+                repeat=getattr(test_case, '_bench_repeat', DEFAULT_REPEAT),
+            )
+            result['params'] = {
+                key: repr(value) for key, value in combination.items()}
+            with self.lock:
+                self.results.setdefault(test_case.id(), {})[str(index)] = result
+            self.check(test_case, str(index), result)
+            return result
+        return measure_call
+
+    def check(self, test_case, cell, result):
+        base = self.baseline.get(test_case.id(), {}).get(cell)
+        if base is None or base['params'] != result['params']:
+            return
+        threshold = self.threshold
+        if threshold is None:
+            threshold = getattr(test_case, '_bench_threshold', DEFAULT_THRESHOLD)
+        if result['min'] > base['min'] * (1 + threshold):
+            test_case.fail(
+                f"{result['min'] / base['min'] - 1:.1%} slower than baseline "
+                f"({_format_time(result['min'])} vs {_format_time(base['min'])}, "
+                f"threshold {threshold:.1%})")
+
+    def save(self):
+        # Other processes may be saving to the same file
+        with _process.locked(self.path):
+            results = load_results(self.path)
+            with self.lock:
+                for test_id, cells in self.results.items():
+                    results.setdefault(test_id, {}).update(cells)
+            save_results(self.path, results)
+
+
+def _setup_benchmark():
+    path = os.environ.get(BENCH_ENV)
+    if not path:
+        return None
+    baseline_path = os.environ.get(BASELINE_ENV)
+    threshold = os.environ.get(THRESHOLD_ENV)
+    benchmark = Benchmark(
+        path,
+        load_results(baseline_path) if baseline_path else None,
+        float(threshold) if threshold else None,
+    )
+    atexit.register(benchmark.save)
+    return benchmark
+
+
+_benchmark = _process.Active(_setup_benchmark)
+
+
+def active_benchmark():
+    """The benchmark for this run, if ``REPEATED_TEST_BENCH`` is set"""
+    return _benchmark.get()
+
+
+def _format_time(seconds):
+    for unit, scale in (('s', 1), ('ms', 1e-3), ('us', 1e-6)):
+        if seconds >= scale:
+            return f'{seconds / scale:.3g}{unit}'
+    return f'{seconds / 1e-9:.3g}ns'
+
+
+def _cell_name(test_id, cell, result):
+    params = ', '.join(f'{key}={value}' for key, value in result['params'].items())
+    return f'{test_id}[{cell}]' + (f' ({params})' if params else '')
+
+
+def main(argv=None, out=sys.stdout):
+    parser = argparse.ArgumentParser(
+        prog='python -m repeated_test.bench',
+        description="Shows benchmark results, or compares them to a baseline")
+    parser.add_argument('results')
+    parser.add_argument('--baseline')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument('--stat', choices=('min', 'mean'), default='min')
+    args = parser.parse_args(argv)
+    results = load_results(args.results)
+    if args.baseline is None:
+        for test_id, cells in sorted(results.items()):
+            for cell, result in sorted(cells.items(), key=lambda item: int(item[0])):
+                print(f"{_cell_name(test_id, cell, result)}: "
+                      f"mean {_format_time(result['mean'])} "
+                      f"+- {_format_time(result['stdev'])}, "
+                      f"min {_format_time(result['min'])}", file=out)
+        return 0
+    regressions = 0
+    for test_id, cell, base, current, ratio, regressed in compare(
+            load_results(args.baseline), results, args.threshold, args.stat):
+        regressions += regressed
+        print(f"{'REGRESSED' if regressed else 'ok':9} {ratio - 1:+7.1%} "
+              f"{_format_time(base)} -> {_format_time(current)} "
+              f"{_cell_name(test_id, cell, results[test_id][cell])}", file=out)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
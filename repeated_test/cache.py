@@ -0,0 +1,214 @@
+# repeated_test -- A framework for repeating a test over many values
+# Copyright (C) 2011-2022 by Yann Kaiser and contributors. See AUTHORS and
+# COPYING for details.
+
+"""On-disk index of the tests found in ``Fixtures`` modules.
+
+Collecting a module means importing it, which runs every ``Fixtures`` class
+body. The index keeps, for each source file, the test ids it produced, so
+that test ids can be listed (and partitioned between workers) without
+importing anything.
+
+Fixture tables aren't cached: the modules holding selected tests are imported
+as usual, building all of their classes and fixtures, even those that won't
+run.
+
+Entries are invalidated when the source file changes, or a file under the
+root directory that defines a base class of its tests does: a changed mtime
+or size triggers a hash comparison, and only a changed hash forces a
+re-import.
+"""
+
+import argparse
+from fnmatch import fnmatch
+import hashlib
+import importlib
+import importlib.util
+import json
+import os
+import sys
+import unittest
+
+from repeated_test import _process
+
+
+CACHE_ENV = 'REPEATED_TEST_CACHE'
+DEFAULT_CACHE_PATH = '.repeated_test_cache.json'
+
+def _iter_tests(suite):
+    for test in suite:
+        if isinstance(test, unittest.TestSuite):
+            yield from _iter_tests(test)
+        else:
+            yield test
+
+
+def _file_hash(filename):
+    with open(filename, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _file_state(filename):
+    stat = os.stat(filename)
+    return {
+        'stat': [stat.st_mtime_ns, stat.st_size],
+        'sha256': _file_hash(filename),
+    }
+
+
+class CollectionCache:
+    """Index of the test ids of each module, stored in a JSON file
+
+    Base classes defined in files under ``root``, the current directory by
+    default, are tracked along with the modules using them.
+    """
+
+    def __init__(self, path=None, loader=None, root=None):
+        self.path = path or os.environ.get(CACHE_ENV) or DEFAULT_CACHE_PATH
+        self.loader = loader or unittest.TestLoader()
+        self.root = os.path.realpath(root or os.getcwd())
+        self._entries = None
+        self._dirty = False
+
+    @property
+    def entries(self):
+        if self._entries is None:
+            try:
+                with open(self.path, encoding='utf-8') as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def save(self):
+        if not self._dirty:
+            return
+        _process.write_json(self.path, self.entries, indent=1)
+        self._dirty = False
+
+    def _is_current(self, filename, state):
+        """Tells whether a file is unchanged since ``state`` was recorded"""
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            return False
+        if [stat.st_mtime_ns, stat.st_size] == state['stat']:
+            return True
+        if _file_hash(filename) != state['sha256']:
+            return False
+        state['stat'] = [stat.st_mtime_ns, stat.st_size]
+        self._dirty = True
+        return True
+
+    def lookup(self, filename):
+        """Returns the entry for ``filename`` if it and the files defining
+        the base classes of its tests are still up to date"""
+        filename = os.path.abspath(filename)
+        entry = self.entries.get(filename)
+        if entry is None or 'dependencies' not in entry:
+            return None
+        if not self._is_current(filename, entry):
+            return None
+        for dependency, state in entry['dependencies'].items():
+            if not self._is_current(dependency, state):
+                return None
+        return entry
+
+    def _dependencies(self, filename, tests):
+        """Lists the files under the root directory that define the classes
+        tests are instances of, or their bases"""
+        filenames = set()
+        for cls in {type(test) for test in tests}:
+            for klass in cls.__mro__:
+                module = sys.modules.get(klass.__module__)
+                dependency = getattr(module, '__file__', None)
+                if dependency and dependency.endswith('.py'):
+                    dependency = _process.project_file(dependency, self.root)
+                    if dependency is not None:
+                        filenames.add(dependency)
+        filenames.discard(os.path.realpath(filename))
+        return sorted(filenames)
+
+    def update(self, filename, module):
+        """Records the tests of an imported module"""
+        filename = os.path.abspath(filename)
+        tests = list(_iter_tests(self.loader.loadTestsFromModule(module)))
+        entry = self.entries[filename] = {
+            'module': module.__name__,
+            **_file_state(filename),
+            'tests': [test.id() for test in tests],
+            'dependencies': {
+                dependency: _file_state(dependency)
+                for dependency in self._dependencies(filename, tests)
+            },
+        }
+        self._dirty = True
+        return entry
+
+    def collect(self, module_name, filename=None):
+        """Lists the test ids of a module, importing it only if needed"""
+        if filename is None:
+            filename = importlib.util.find_spec(module_name).origin
+        entry = self.lookup(filename)
+        if entry is None or entry['module'] != module_name:
+            module = importlib.import_module(module_name)
+            entry = self.update(filename, module)
+        return entry['tests']
+
+    def discover(self, start_dir, pattern='test*.py', top_level_dir=None):
+        """Lists the test ids found under ``start_dir``
+
+        Modules are found the same way as ``unittest`` discovery does, without
+        support for ``load_tests`` hooks.
+        """
+        top_level_dir = os.path.abspath(top_level_dir or start_dir)
+        if top_level_dir not in sys.path:
+            sys.path.insert(0, top_level_dir)
+        ids = []
+        for module_name, filename in find_modules(
+                start_dir, pattern, top_level_dir):
+            ids.extend(self.collect(module_name, filename))
+        self.save()
+        return ids
+
+
+def find_modules(start_dir, pattern='test*.py', top_level_dir=None):
+    """Lists ``(module_name, filename)`` for the modules under ``start_dir``
+    whose file name matches ``pattern``, in packages as unittest discovery
+    finds them"""
+    start_dir = os.path.abspath(start_dir)
+    top_level_dir = os.path.abspath(top_level_dir or start_dir)
+    for dirpath, dirnames, filenames in os.walk(start_dir):
+        dirnames[:] = sorted(
+            name for name in dirnames
+            if os.path.isfile(os.path.join(dirpath, name, '__init__.py'))
+        )
+        for name in sorted(filenames):
+            if not name.endswith('.py') or not fnmatch(name, pattern):
+                continue
+            filename = os.path.join(dirpath, name)
+            relpath = os.path.relpath(filename, top_level_dir)
+            module_name = os.path.splitext(relpath)[0].replace(os.sep, '.')
+            yield module_name, filename
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m repeated_test.cache',
+        description="Lists test ids, importing only modules that changed "
+                    "since they were last collected")
+    parser.add_argument('start_dir', nargs='?', default='.')
+    parser.add_argument('-p', '--pattern', default='test*.py')
+    parser.add_argument('-t', '--top-level-directory', default=None)
+    parser.add_argument('--cache', default=None,
+                        help=f"index file (default: ${CACHE_ENV} or "
+                             f"{DEFAULT_CACHE_PATH})")
+    args = parser.parse_args(argv)
+    cache = CollectionCache(args.cache)
+    for test_id in cache.discover(
+            args.start_dir, args.pattern, args.top_level_directory):
+        print(test_id)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,20 +2,54 @@
 # Copyright (C) 2011-2022 by Yann Kaiser and contributors. See AUTHORS and
 # COPYING for details.
 
-import itertools
+import contextlib
+import functools
+import importlib
+import os
 import sys
-import traceback
 import unittest
 
 import collections
 
 from repeated_test.utils import options, options_to_kwargs
-from repeated_test import _evaluated
+from repeated_test import _abort, _blob, _evaluated, _explore, _lazy, _matrix, _resources
 
 
 __unittest = True # hides frames from this file from unittest output
 
 
+# Optional features aren't imported until the environment variables that
+# enable them are set, or until something else imports them
+_feature_environ = {
+    'bench': ('REPEATED_TEST_BENCH',),
+    'impact': ('REPEATED_TEST_IMPACT_RECORD', 'REPEATED_TEST_IMPACT_SELECT'),
+    'schedule': ('REPEATED_TEST_DURATIONS',),
+}
+
+
+def _feature(name):
+    """Returns the module of an optional feature, or None if it isn't used"""
+    module = sys.modules.get('repeated_test.' + name)
+    if module is None and any(
+            os.environ.get(var) for var in _feature_environ[name]):
+        module = importlib.import_module('repeated_test.' + name)
+    return module
+
+
+def _recording(test_id, index, count, location):
+    impact = _feature('impact')
+    if impact is None:
+        return contextlib.nullcontext()
+    return impact.recording(test_id, index, count, location)
+
+
+def _timing(test_id, index=None):
+    schedule = _feature('schedule')
+    if schedule is None:
+        return contextlib.nullcontext()
+    return schedule.timing(test_id, index)
+
+
 class FixturesDict(collections.abc.MutableMapping):
     def __init__(self, *args, **kwargs):
         self.d = {}
@@ -40,10 +74,10 @@ class FixturesDict(collections.abc.MutableMapping):
                 if 'test_' + key in self.d:
                     raise ValueError(
                         "Fixture conflicts with plain test: " + key)
-                if isinstance(value, _evaluated.Evaluated):
+                if isinstance(value, (_evaluated.Evaluated, _lazy.Lazy, _blob.Blob)):
                     value = value,
                 value = options.get_active_options() + tuple(value)
-        self.lines[key] = traceback.extract_stack(sys._getframe(1), 1)[0][:3]
+        self.lines[key] = _frame_location(sys._getframe(1))
         self.d[key] = value
 
     def __getitem__(self, key):
@@ -53,9 +87,31 @@ class FixturesDict(collections.abc.MutableMapping):
         del self.d[key]
 
 
+def _frame_location(frame):
+    # Same as traceback.extract_stack(frame, 1)[0][:3], minus the linecache
+    # lookup of the source line that we never use
+    code = frame.f_code
+    return code.co_filename, frame.f_lineno, code.co_name
+
+
 OPTIONS_MATRIX_KEY = '_repeated_test__options_matrix'
 
 
+def _is_fixture_name(key):
+    return not key.startswith('test_') and not key.startswith('_')
+
+
+def _fixture_lines(cls):
+    # Fixtures defined by base classes come first, as in the test methods
+    # the subclass inherits
+    lines = {}
+    for base in reversed(cls.__mro__):
+        for key, line in base.__dict__.get('_repeated_test__lines', {}).items():
+            if _is_fixture_name(key):
+                lines[key] = line
+    return lines
+
+
 def find_member_in_bases(bases, key, default):
     for base in bases:
         for cls in base.__mro__:
@@ -64,6 +120,19 @@ def find_member_in_bases(bases, key, default):
     return default
 
 
+class _SelectedTests:
+    # Lets test cases be made for "test_fixture[17]" like for other methods,
+    # as they aren't stored in the class
+    def __getattr__(self, name):
+        if _matrix.selected_name_re.match(name) is not None:
+            return getattr(type(self), name).__get__(self)
+        parent = getattr(super(), '__getattr__', None)
+        if parent is None:
+            raise AttributeError(
+                f'{type(self).__name__!r} object has no attribute {name!r}')
+        return parent(name)
+
+
 class FixturesMeta(type):
     @classmethod
     def __prepare__(cls, name, bases, TestCase=None):
@@ -73,25 +142,28 @@ class FixturesMeta(type):
         return ret
 
     def __new__(meta, name, bases, d, TestCase=None):
-        container_loc = traceback.extract_stack(sys._getframe(1), 2)[0][:3]
+        # The caller of the code defining the class, or that code itself when
+        # nothing calls it, like the top level of a script
+        frame = sys._getframe(1)
+        container_loc = _frame_location(frame.f_back or frame)
         TestCase = d.get('_TestCase', TestCase or unittest.TestCase)
         members = dict(d.d)
         for key, value in d.d.items():
-            if not key.startswith('test_') and not key.startswith('_'):
+            if _is_fixture_name(key):
                 members['test_' + key] = _make_testfunc_runner(
                     value, d.lines.get(key), container_loc, name, key)
         bases = tuple(b for b in bases if b is not object)
         if '_test' not in members:
             raise ValueError("'_test' function missing from Fixtures class")
         if members['_test'] is not None:
-            bases = bases + (TestCase,)
+            bases = bases + (_SelectedTests, TestCase)
         members['_repeated_test__lines'] = d.lines
         members['_TestCase'] = TestCase
         options_matrix_in_base = find_member_in_bases(bases, OPTIONS_MATRIX_KEY, {})
         options_matrix = members.get(OPTIONS_MATRIX_KEY, {})
         members[OPTIONS_MATRIX_KEY] = {
             **options_matrix_in_base,
-            **options_matrix,
+            **_matrix.materialized(options_matrix),
         }
         return super(FixturesMeta, meta).__new__(meta, name, bases, members)
 
@@ -101,7 +173,9 @@ class FixturesMeta(type):
 
     def update(cls, *, func=None, options_matrix=None):
         meta = type(cls)
-        tc_cls = (cls._TestCase,) if cls.__dict__['_test'] is None else ()
+        tc_cls = (
+            (_SelectedTests, cls._TestCase)
+            if cls.__dict__['_test'] is None else ())
         bases = tuple(b for b in cls.__bases__ if b is not object) + tc_cls
         members = dict(cls.__dict__)
         name = func.__name__ if func else cls.__name__
@@ -110,7 +184,7 @@ class FixturesMeta(type):
         original_options_matrix = members.get(OPTIONS_MATRIX_KEY, {})
         options_matrix = {
             **original_options_matrix,
-            **(options_matrix or {}),
+            **_matrix.materialized(options_matrix or {}),
         }
         members[OPTIONS_MATRIX_KEY] = options_matrix
         return super(FixturesMeta, meta).__new__(
@@ -122,6 +196,22 @@ class FixturesMeta(type):
     def with_options_matrix(cls, **options_matrix):
         return cls.update(options_matrix=options_matrix)
 
+    def __getattr__(cls, name):
+        # Makes "test_fixture[17]" or "test_fixture[key=value]" available as
+        # a test method that only runs the selected combinations
+        match = _matrix.selected_name_re.match(name)
+        if match is None or match.group(1)[5:] not in _fixture_lines(cls):
+            raise AttributeError(name)
+        runner = getattr(cls, match.group(1))
+        selector = match.group(2)
+        def run_selected(self):
+            return runner(self, selector)
+        run_selected.__name__ = name
+        run_selected.__qualname__ = cls.__qualname__ + '.' + name
+        # Not stored in the class, or the loader would list it among the
+        # class's tests
+        return run_selected
+
 
 class Fixtures(metaclass=FixturesMeta):
     _test = None
@@ -136,41 +226,152 @@ def WithTestClass(cls):
 
 def _make_testfunc_runner(value, fake_loc,
                           container_loc, cls_name, member_name):
-    def _run_test_matrix(self):
-        matrix = getattr(self, OPTIONS_MATRIX_KEY)
-        args, kwargs = options.split_into_args_kwargs(value)
-
-        combo_source = (
-            (lambda key: ((key, value) for value in values))(latest_key)
-            for latest_key, values in matrix.items()
-            if latest_key not in kwargs
-        )
-
-        product = itertools.product(*combo_source)
+    def _run_test_matrix(self, selector=None):
+        try:
+            # keepalive holds lazy values in their cache until we're done
+            items, keepalive = _lazy.resolve_items(value)
+        except Exception:
+            typ, exc, tb = sys.exc_info()
+            _raise_at_custom_line(*fake_loc)(typ, exc, tb.tb_next)
+        return _run_resolved_test_matrix(self, items, selector)
 
-        first_two = list(itertools.islice(product, 2))
+    def _run_resolved_test_matrix(self, items, selector):
+        matrix = getattr(self, OPTIONS_MATRIX_KEY)
+        args, kwargs = options.split_into_args_kwargs(items)
+        axes = _matrix.matrix_axes(matrix, kwargs)
+        count = _matrix.combination_count(axes)
 
-        if len(first_two) == 0:
+        if count == 0:
             raise ValueError("Some options have no values")
-        if len(first_two) == 1:
-            return _run_test(self, args, options_to_kwargs(dict(
-                first_two[0] or {},
-                **kwargs,
-            )))
+        if selector is None:
+            selector = _matrix.selector_from_environ(self.id())
+        if selector is not None:
+            indexes = _matrix.select_indexes(axes, selector)
+        else:
+            impact = _feature('impact')
+            indexes = impact and impact.selected_indexes(self.id(), count)
+            if indexes == []:
+                self.skipTest("Not affected by changes")
+            elif indexes is None:
+                indexes = range(count)
+
+        bench = _feature('bench')
+        benchmark = bench and bench.active_benchmark()
+        impact_loc = (*fake_loc[:2], member_name)
+
+        def run_combination(test_case, index, combination):
+            measure = benchmark and benchmark.measure_for(
+                test_case, index, combination)
+            with _recording(test_case.id(), index, count, impact_loc), \
+                    _timing(test_case.id(), index):
+                return _run_test(test_case, args, options_to_kwargs({
+                    **combination,
+                    **kwargs,
+                }), measure)
+
+        if (
+            _explore.is_explored(axes)
+            and len(indexes) == count > _explore.budget_for(self)
+        ):
+            with _timing(self.id()):
+                return _run_explored(self, axes, count, run_combination)
+
+        # Like parallel.workers_for, without importing it for every test
+        threaded = benchmark is None and (
+            getattr(self, '_workers', None) or 1) > 1
+        if len(indexes) < count:
+            # Only record how long all combinations take
+            return _run_combinations(
+                self, axes, count, indexes, threaded, run_combination)
+        with _timing(self.id()):
+            return _run_combinations(
+                self, axes, count, indexes, threaded, run_combination)
+
+    def _run_combinations(self, axes, count, indexes, threaded,
+                          run_combination):
+        state = _abort.state_for(self)
+        if count == 1:
+            if state.should_abort():
+                self.skipTest(state.summary([0], count))
+            with state.recording():
+                return run_combination(
+                    self, 0, _matrix.combination_at(axes, 0))
+        elif threaded:
+            _run_combinations_threaded(
+                self, axes, count, indexes, state, run_combination)
         else:
-            for kv_pairs in itertools.chain(first_two, product):
-                combination = dict(kv_pairs)
-                with self.subTest(**combination):
-                    _run_test(self, args, options_to_kwargs({
-                        **combination,
-                        **kwargs,
-                    }))
-
-    def _run_test(self, args, kwargs):
-        evaluated = _evaluated.flatten_evaluated_items(self, args, kwargs)
-        args, kwargs_overrides = options.split_into_args_kwargs(evaluated)
+            indexes = iter(indexes)
+            for index in indexes:
+                if state.should_abort():
+                    with self.subTest("aborted"):
+                        self.skipTest(state.summary([index, *indexes], count))
+                    break
+                combination = _matrix.combination_at(axes, index)
+                with self.subTest(index, **combination), state.recording():
+                    run_combination(self, index, combination)
+
+    def _run_explored(self, axes, count, run_combination):
+        from repeated_test import parallel
+
+        def run(index):
+            # Combinations that are tried report nothing by themselves
+            return parallel.CapturedTest(
+                self, run_combination, index,
+                _matrix.combination_at(axes, index))
+
+        found = _explore.Search(
+            axes, _explore.budget_for(self), _explore.random_for(self), run,
+        ).search()
+        if found is not None:
+            index, captured = found
+            with self.subTest(index, **_matrix.combination_at(axes, index)):
+                captured.replay(self)
+
+    def _run_combinations_threaded(self, axes, count, indexes, state,
+                                   run_combination):
+        from repeated_test import parallel
+
+        def run_in_thread(index):
+            if state.should_abort():
+                return index, None, None
+            # Each thread gets its own test case, whose subtests are recorded
+            # and reported once it is the combination's turn
+            combination = _matrix.combination_at(axes, index)
+            def run(test_case):
+                with state.recording():
+                    run_combination(test_case, index, combination)
+            return index, combination, parallel.CapturedTest(self, run)
+
+        not_run = []
+        for index, combination, captured in parallel.imap_ordered(
+                parallel.workers_for(self), run_in_thread, indexes):
+            if captured is None:
+                not_run.append(index)
+                continue
+            with self.subTest(index, **combination):
+                captured.replay(self)
+        if not_run:
+            with self.subTest("aborted"):
+                self.skipTest(state.summary(not_run, count))
+
+    def _run_test(self, args, kwargs, measure=None):
         try:
-            return self._test(*args, **kwargs, **kwargs_overrides)
+            # Evaluated functions get views of blobs, like the test does
+            with _blob.opened(args, kwargs) as (args, kwargs):
+                evaluated = _evaluated.flatten_evaluated_items(
+                    self, args, kwargs)
+                args, kwargs_overrides = options.split_into_args_kwargs(
+                    evaluated)
+                with _blob.opened(args, kwargs_overrides) as (
+                        args, kwargs_overrides), \
+                        _resources.checkout_resources(
+                            self, {**kwargs, **kwargs_overrides}) as resources:
+                    if measure is None:
+                        return self._test(
+                            *args, **kwargs, **kwargs_overrides, **resources)
+                    return measure(functools.partial(
+                        _feature('bench').function_for(self),
+                        *args, **kwargs, **kwargs_overrides, **resources))
         except Exception as exc:
             typ, exc, tb = sys.exc_info()
             _raise_at_custom_line(*fake_loc)(typ, exc, tb.tb_next)
@@ -0,0 +1,400 @@
+# repeated_test -- A framework for repeating a test over many values
+# Copyright (C) 2011-2022 by Yann Kaiser and contributors. See AUTHORS and
+# COPYING for details.
+
+"""Test impact analysis at the granularity of fixtures and combinations.
+
+With ``REPEATED_TEST_IMPACT_RECORD=impact.json``, every combination that runs
+is traced, and the functions it called are saved in an index when the
+process exits.
+
+With ``REPEATED_TEST_IMPACT_SELECT=impact.json``, combinations whose recorded
+functions weren't changed are skipped. Changes are read from
+``git diff -U0 $REPEATED_TEST_IMPACT_DIFF`` (``HEAD`` by default), or from the
+``os.pathsep``-separated list of files in ``REPEATED_TEST_IMPACT_CHANGED``.
+Tests missing from the index, or whose number of combinations changed, always
+run.
+
+``python -m repeated_test.impact`` lists the ids of the affected tests.
+"""
+
+import argparse
+import atexit
+import contextlib
+import dis
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+
+from repeated_test import _process
+
+
+RECORD_ENV = 'REPEATED_TEST_IMPACT_RECORD'
+SELECT_ENV = 'REPEATED_TEST_IMPACT_SELECT'
+DIFF_ENV = 'REPEATED_TEST_IMPACT_DIFF'
+CHANGED_ENV = 'REPEATED_TEST_IMPACT_CHANGED'
+
+INDEX_VERSION = 1
+
+
+def _code_span(code):
+    lines = [line for _, line in dis.findlinestarts(code) if line is not None]
+    return code.co_firstlineno, max(lines, default=code.co_firstlineno)
+
+
+class _SettraceTracer:
+    """Collects the code objects called in the current thread"""
+
+    def __init__(self):
+        self.codes = set()
+
+    def _trace(self, frame, event, arg):
+        if event == 'call':
+            self.codes.add(frame.f_code)
+        return None
+
+    def __enter__(self):
+        self._previous = sys.gettrace()
+        sys.settrace(self._trace)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        sys.settrace(self._previous)
+
+
+class _MonitoringTracer:
+    """Collects the code objects that start running in the current thread,
+    using sys.monitoring
+
+    Events are process-wide: they are enabled while any thread records, and
+    each goes to the recording of the thread it happens in, if any. They
+    aren't disabled once seen, as other threads may be recording too.
+    """
+
+    _lock = threading.Lock()
+    _recording_count = 0
+    _current = threading.local()
+    _tool_id = None
+
+    def __init__(self):
+        self.codes = set()
+
+    @classmethod
+    def available(cls):
+        if not hasattr(sys, 'monitoring'):
+            return False
+        if cls._tool_id is None:
+            for tool_id in (3, 4):
+                if sys.monitoring.get_tool(tool_id) is None:
+                    sys.monitoring.use_tool_id(tool_id, 'repeated_test')
+                    cls._tool_id = tool_id
+                    break
+        return cls._tool_id is not None
+
+    @classmethod
+    def _on_start(cls, code, instruction_offset):
+        tracer = getattr(cls._current, 'tracer', None)
+        if tracer is not None:
+            tracer.codes.add(code)
+
+    def __enter__(self):
+        cls = type(self)
+        self._previous = getattr(cls._current, 'tracer', None)
+        cls._current.tracer = self
+        with cls._lock:
+            if cls._recording_count == 0:
+                monitoring = sys.monitoring
+                monitoring.register_callback(
+                    cls._tool_id, monitoring.events.PY_START, cls._on_start)
+                monitoring.set_events(
+                    cls._tool_id, monitoring.events.PY_START)
+            cls._recording_count += 1
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        cls = type(self)
+        cls._current.tracer = self._previous
+        with cls._lock:
+            cls._recording_count -= 1
+            if cls._recording_count == 0:
+                monitoring = sys.monitoring
+                monitoring.set_events(cls._tool_id, 0)
+                monitoring.register_callback(
+                    cls._tool_id, monitoring.events.PY_START, None)
+
+
+def _make_tracer():
+    if _MonitoringTracer.available():
+        return _MonitoringTracer()
+    return _SettraceTracer()
+
+
+class Recorder:
+    """Maps each combination that runs to the functions it called"""
+
+    def __init__(self, path, root=None):
+        self.path = path
+        self.root = os.path.realpath(root or os.getcwd())
+        self.tests = {}
+        self.lock = threading.Lock()
+        self._paths = {}
+
+    def _relpath(self, filename):
+        try:
+            return self._paths[filename]
+        except KeyError:
+            pass
+        path = _process.project_file(filename, self.root)
+        relpath = path and os.path.relpath(path, self.root)
+        self._paths[filename] = relpath
+        return relpath
+
+    def _functions(self, codes, location):
+        functions = set()
+        filename, lineno, fixture = location
+        relpath = self._relpath(filename)
+        if relpath is not None:
+            # The fixture's own line, so that editing it selects the fixture
+            functions.add((relpath, f'<fixture {fixture}>', lineno, lineno))
+        for code in codes:
+            relpath = self._relpath(code.co_filename)
+            if relpath is not None:
+                qualname = getattr(code, 'co_qualname', code.co_name)
+                functions.add((relpath, qualname, *_code_span(code)))
+        return functions
+
+    @contextlib.contextmanager
+    def recording(self, test_id, index, count, location):
+        tracer = _make_tracer()
+        try:
+            with tracer:
+                yield
+        finally:
+            functions = self._functions(tracer.codes, location)
+            with self.lock:
+                entry = self.tests.setdefault(
+                    test_id, {'count': count, 'cells': {}})
+                entry['count'] = count
+                entry['cells'][str(index)] = functions
+
+    def save(self):
+        # Other processes may be saving to the same file
+        with _process.locked(self.path):
+            self._save()
+
+    def _save(self):
+        index = load_index(self.path) or {
+            'version': INDEX_VERSION, 'functions': [], 'tests': {}}
+        functions = [tuple(function) for function in index['functions']]
+        function_ids = {function: i for i, function in enumerate(functions)}
+
+        def function_id(function):
+            try:
+                return function_ids[function]
+            except KeyError:
+                functions.append(function)
+                function_ids[function] = len(functions) - 1
+                return function_ids[function]
+
+        with self.lock:
+            for test_id, recorded in self.tests.items():
+                entry = index['tests'].get(test_id)
+                if entry is None or entry['count'] != recorded['count']:
+                    entry = index['tests'][test_id] = {
+                        'count': recorded['count'], 'cells': {}}
+                for cell, cell_functions in recorded['cells'].items():
+                    entry['cells'][cell] = sorted(
+                        function_id(function) for function in cell_functions)
+        index['functions'] = [list(function) for function in functions]
+        _process.write_json(self.path, index, separators=(',', ':'))
+
+
+def load_index(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            index = json.load(f)
+    except FileNotFoundError:
+        return None
+    if index.get('version') != INDEX_VERSION:
+        return None
+    return index
+
+
+_hunk_re = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+\d+(?:,\d+)? @@')
+
+
+def parse_diff(diff):
+    """Reads the lines a unified diff changes, as ``{path: lines}``
+
+    Lines are numbered as in the old version of each file, which is the one
+    the index was recorded with. ``lines`` is None for files that were added.
+    """
+    changes = {}
+    old_path = None
+    lines = None
+    for line in diff.splitlines():
+        if line.startswith('--- '):
+            old_path = line[4:].strip()
+            old_path = None if old_path == '/dev/null' else old_path[2:]
+        elif line.startswith('+++ '):
+            new_path = line[4:].strip()
+            if old_path is None:
+                changes[new_path[2:]] = None
+                lines = None
+            else:
+                lines = changes.setdefault(old_path, set())
+        elif lines is not None:
+            match = _hunk_re.match(line)
+            if match:
+                start = int(match.group(1))
+                length = 1 if match.group(2) is None else int(match.group(2))
+                if length == 0:
+                    # Lines inserted after ``start``
+                    lines.update((start, start + 1))
+                else:
+                    lines.update(range(start, start + length))
+    return changes
+
+
+def git_changes(rev='HEAD', cwd=None):
+    """Reads the lines changed since ``rev``, with paths relative to cwd"""
+    top = subprocess.run(
+        ['git', 'rev-parse', '--show-toplevel'], cwd=cwd,
+        check=True, capture_output=True, text=True).stdout.strip()
+    diff = subprocess.run(
+        ['git', 'diff', '-U0', '--no-color', '--no-ext-diff', rev, '--'],
+        cwd=cwd, check=True, capture_output=True, text=True).stdout
+    base = os.path.realpath(cwd or os.getcwd())
+    return {
+        os.path.relpath(os.path.join(top, path), base): lines
+        for path, lines in parse_diff(diff).items()
+    }
+
+
+class Selection:
+    """Decides which recorded combinations are affected by changes
+
+    ``changes`` maps paths, relative to the directory the index was recorded
+    from, to the changed line numbers, or to None if the whole file changed.
+    A changed line that isn't part of any recorded function, such as a
+    module-level statement, affects every function of its file.
+    """
+
+    def __init__(self, index, changes):
+        self.tests = index['tests']
+        changes = {os.path.normpath(path): lines for path, lines in changes.items()}
+        functions_by_file = {}
+        for function_id, (path, _, first, last) in enumerate(index['functions']):
+            functions_by_file.setdefault(path, []).append(
+                (function_id, first, last))
+        self.affected_functions = set()
+        for path, lines in changes.items():
+            functions = functions_by_file.get(path, [])
+            if lines is None or any(
+                    not any(first <= line <= last for _, first, last in functions)
+                    for line in lines):
+                self.affected_functions.update(
+                    function_id for function_id, _, _ in functions)
+            else:
+                self.affected_functions.update(
+                    function_id for function_id, first, last in functions
+                    if any(first <= line <= last for line in lines))
+
+    def affected_indexes(self, test_id, count):
+        """Lists the affected combinations of a test, or None if it is unknown
+        and should run entirely"""
+        entry = self.tests.get(test_id)
+        if entry is None or entry['count'] != count:
+            return None
+        return sorted(
+            int(cell) for cell, functions in entry['cells'].items()
+            if self.affected_functions.intersection(functions)
+        )
+
+    def affected_tests(self):
+        return sorted(
+            test_id for test_id, entry in self.tests.items()
+            if self.affected_indexes(test_id, entry['count'])
+        )
+
+
+def changes_from_environ(environ=os.environ):
+    changed = environ.get(CHANGED_ENV)
+    if changed is not None:
+        return {path: None for path in changed.split(os.pathsep) if path}
+    return git_changes(environ.get(DIFF_ENV) or 'HEAD')
+
+
+def _setup_recorder():
+    path = os.environ.get(RECORD_ENV)
+    if not path:
+        return None
+    recorder = Recorder(path)
+    atexit.register(recorder.save)
+    return recorder
+
+
+def _setup_selection():
+    path = os.environ.get(SELECT_ENV)
+    index = path and load_index(path)
+    return Selection(index, changes_from_environ()) if index else None
+
+
+_recorder = _process.Active(_setup_recorder)
+_selection = _process.Active(_setup_selection)
+
+
+def active_recorder():
+    return _recorder.get()
+
+
+def active_selection():
+    return _selection.get()
+
+
+def recording(test_id, index, count, location):
+    """Records the functions a combination calls, if recording is enabled
+
+    location is the ``(filename, lineno, fixture_name)`` of the fixture.
+    """
+    recorder = active_recorder()
+    if recorder is None:
+        return contextlib.nullcontext()
+    return recorder.recording(test_id, index, count, location)
+
+
+def selected_indexes(test_id, count):
+    """Lists the combinations of a test to run, or None to run all of them"""
+    selection = active_selection()
+    if selection is None:
+        return None
+    return selection.affected_indexes(test_id, count)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m repeated_test.impact',
+        description="Lists the recorded tests affected by changes")
+    parser.add_argument('--index', required=True,
+                        help="index written with " + RECORD_ENV)
+    parser.add_argument('--diff', default='HEAD', metavar='REV',
+                        help="git revision to compare with (default: HEAD)")
+    parser.add_argument('files', nargs='*',
+                        help="changed files, instead of using git")
+    args = parser.parse_args(argv)
+    index = load_index(args.index)
+    if index is None:
+        parser.error(f"no usable index at {args.index}")
+    if args.files:
+        changes = {path: None for path in args.files}
+    else:
+        changes = git_changes(args.diff)
+    for test_id in Selection(index, changes).affected_tests():
+        print(test_id)
+
+
+if __name__ == '__main__':
+    main()
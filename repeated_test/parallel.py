@@ -0,0 +1,244 @@
+# repeated_test -- A framework for repeating a test over many values
+# Copyright (C) 2011-2022 by Yann Kaiser and contributors. See AUTHORS and
+# COPYING for details.
+
+"""Running tests in a thread pool.
+
+``Fixtures`` classes opt in by setting ``_workers``. Their combinations are
+then run concurrently, and a module can run their test methods concurrently
+by using this module's ``load_tests``::
+
+    from repeated_test.parallel import load_tests
+
+Each test runs against a private result object, whose calls are replayed on
+the runner's result in the usual test order once the test is done. Tests
+start slowest first if durations are recorded, see ``repeated_test.schedule``.
+"""
+
+import collections
+import concurrent.futures
+import contextlib
+import copy
+import functools
+import unittest
+
+from repeated_test import schedule
+
+
+__unittest = True # hides frames from this file from unittest output
+
+
+def workers_for(obj):
+    """The number of threads a test class asks for, or 1"""
+    return getattr(obj, '_workers', None) or 1
+
+
+def imap_ordered(workers, func, iterable):
+    """Like ``map(func, iterable)``, but runs up to ``workers`` calls at once
+
+    Results are yielded in order. Only a bounded number of items are taken
+    from ``iterable`` ahead of the results being consumed.
+    """
+    with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+        pending = collections.deque()
+        try:
+            for item in iterable:
+                pending.append(executor.submit(func, item))
+                if len(pending) >= 2 * workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+class Captured:
+    """Calls a function, keeping its return value or exception for later"""
+
+    def __init__(self, func, *args, **kwargs):
+        self.exception = None
+        try:
+            self.value = func(*args, **kwargs)
+        except BaseException as exc:
+            self.value = None
+            self.exception = exc
+
+    def replay(self):
+        if self.exception is not None:
+            exception, self.exception = self.exception, None
+            raise exception
+        return self.value
+
+
+_unset = object()
+
+
+class CapturedTest(Captured):
+    """Calls a function with a copy of a test case, keeping its outcome and
+    the outcomes of its subtests for later
+
+    The copy reports nothing by itself, as it may run in another thread. Its
+    subtests are recorded instead, and still let the test go on after a
+    failure.
+    """
+
+    def __init__(self, test_case, func, *args):
+        self.subtests = []
+        self._stack = []
+        test_case = copy.copy(test_case)
+        test_case._outcome = None
+        test_case.subTest = self._subtest
+        super().__init__(func, test_case, *args)
+
+    @contextlib.contextmanager
+    def _subtest(self, msg=_unset, **params):
+        self._stack.append((msg, params))
+        try:
+            yield
+        except Exception as exc:
+            self.subtests.append((tuple(self._stack), exc))
+        else:
+            self.subtests.append((tuple(self._stack), None))
+        finally:
+            self._stack.pop()
+
+    @property
+    def failed(self):
+        exceptions = [self.exception, *(exc for _, exc in self.subtests)]
+        return any(
+            exc is not None and not isinstance(exc, unittest.SkipTest)
+            for exc in exceptions)
+
+    def replay(self, test_case):
+        """Reports the recorded subtests as subtests of test_case, then
+        returns the function's value or raises its exception"""
+        for path, exception in self.subtests:
+            with contextlib.ExitStack() as stack:
+                for msg, params in path:
+                    stack.enter_context(
+                        test_case.subTest(**params) if msg is _unset
+                        else test_case.subTest(msg, **params))
+                if exception is not None:
+                    raise exception
+        return super().replay()
+
+
+def _recorded(name):
+    def method(self, *args):
+        self.calls.append((name, args))
+    method.__name__ = name
+    return method
+
+
+class RecordingResult(unittest.TestResult):
+    """Test result that keeps the calls made to it to replay them later"""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    startTest = _recorded('startTest')
+    stopTest = _recorded('stopTest')
+    addSuccess = _recorded('addSuccess')
+    addError = _recorded('addError')
+    addFailure = _recorded('addFailure')
+    addSkip = _recorded('addSkip')
+    addExpectedFailure = _recorded('addExpectedFailure')
+    addUnexpectedSuccess = _recorded('addUnexpectedSuccess')
+    addSubTest = _recorded('addSubTest')
+    addDuration = _recorded('addDuration')
+
+    def replay(self, result):
+        for name, args in self.calls:
+            method = getattr(result, name, None)
+            if method is not None:
+                method(*args)
+
+
+class ThreadPoolSuite(unittest.TestSuite):
+    """Runs its tests in a thread pool, reporting them in order
+
+    Class and module fixtures are handled as usual: tests start running once
+    the first of them would have, which is after ``setUpClass``, and all of
+    them are done by the time the last one is reported.
+    """
+
+    def __init__(self, tests=(), workers=None):
+        super().__init__(tests)
+        self.workers = workers
+
+    def _run_recorded(self, test):
+        recorder = RecordingResult()
+        type(test).run(test, recorder)
+        return recorder
+
+    def _start(self, tests):
+        workers = self.workers or max(workers_for(test) for test in tests)
+        durations = schedule.active_durations()
+        if durations is not None:
+            tests = sorted(
+                tests, key=lambda test: durations.estimate(test.id()),
+                reverse=True)
+        self._executor = concurrent.futures.ThreadPoolExecutor(workers)
+        self._futures = {
+            id(test): self._executor.submit(self._run_recorded, test)
+            for test in tests
+        }
+
+    def _replay(self, tests, test, result=None):
+        if self._futures is None:
+            self._start(tests)
+        self._futures[id(test)].result().replay(result)
+
+    def run(self, result, debug=False):
+        tests = [test for test in self if isinstance(test, unittest.TestCase)]
+        self._futures = None
+        self._executor = None
+        for test in tests:
+            test.run = functools.partial(self._replay, tests, test)
+        try:
+            return super().run(result, debug)
+        finally:
+            for test in tests:
+                del test.run
+            if self._executor is not None:
+                for future in self._futures.values():
+                    future.cancel()
+                self._executor.shutdown()
+            self._futures = self._executor = None
+
+
+def parallelize(suite):
+    """Groups tests of classes that set ``_workers`` in ``ThreadPoolSuite``s"""
+    new_suite = type(suite)()
+    group = []
+
+    def flush():
+        if len(group) > 1:
+            new_suite.addTest(ThreadPoolSuite(group))
+        else:
+            new_suite.addTests(group)
+        group.clear()
+
+    for test in suite:
+        if isinstance(test, unittest.TestSuite):
+            flush()
+            new_suite.addTest(parallelize(test))
+        elif workers_for(test) > 1 and (
+                not group or type(group[0]) is type(test)):
+            group.append(test)
+        else:
+            flush()
+            if workers_for(test) > 1:
+                group.append(test)
+            else:
+                new_suite.addTest(test)
+    flush()
+    return new_suite
+
+
+def load_tests(loader, tests, pattern):
+    """``load_tests`` protocol hook that runs the module's tests with
+    ``parallelize``"""
+    return parallelize(tests)
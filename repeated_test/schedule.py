@@ -0,0 +1,285 @@
+# repeated_test -- A framework for repeating a test over many values
+# Copyright (C) 2011-2022 by Yann Kaiser and contributors. See AUTHORS and
+# COPYING for details.
+
+"""Running the slowest tests first, based on the durations of past runs.
+
+With ``REPEATED_TEST_DURATIONS=durations.json``, the duration of each test
+method generated from a fixture, and of each of its combinations, is saved
+when the process exits.
+
+``ordered`` sorts a suite so that the slowest tests run first, and
+``partition`` splits it between workers so that they finish at about the
+same time, by giving each test in turn, slowest first, to the worker with the
+least work. Tests without a recorded duration are estimated from the other
+tests of their class, or else from all recorded tests. A module can order its
+tests with this module's ``load_tests``::
+
+    from repeated_test.schedule import load_tests
+
+``ThreadPoolSuite`` also starts the slowest tests first, while still
+reporting them in order.
+
+``python -m repeated_test.schedule`` splits discovered tests between workers
+and lists the ids of each worker's tests.
+"""
+
+import argparse
+import atexit
+import contextlib
+import heapq
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+import unittest
+
+from repeated_test import _process
+
+
+DURATIONS_ENV = 'REPEATED_TEST_DURATIONS'
+
+DURATIONS_VERSION = 1
+
+DEFAULT_ESTIMATE = 0.01
+
+
+def _class_id(test_id):
+    return test_id.rpartition('.')[0]
+
+
+def load_durations(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            durations = json.load(f)
+    except FileNotFoundError:
+        return {}
+    if durations.get('version') != DURATIONS_VERSION:
+        return {}
+    return durations['tests']
+
+
+def save_durations(path, tests):
+    _process.write_json(
+        path, {'version': DURATIONS_VERSION, 'tests': tests}, indent=1)
+
+
+class Durations:
+    """Durations of test methods and of their combinations, in seconds
+
+    ``tests`` maps test ids to ``{'duration': seconds, 'cells': {index:
+    seconds}}``, where ``duration`` is absent until all of a method's
+    combinations are run together.
+    """
+
+    def __init__(self, tests=None, path=None):
+        self.tests = tests or {}
+        self.path = path
+        self.recorded = {}
+        self.lock = threading.Lock()
+        self._estimates = None
+
+    @classmethod
+    def load(cls, path):
+        return cls(load_durations(path), path)
+
+    def record(self, test_id, seconds, index=None):
+        with self.lock:
+            for tests in (self.tests, self.recorded):
+                entry = tests.setdefault(test_id, {'cells': {}})
+                if index is None:
+                    entry['duration'] = seconds
+                else:
+                    entry['cells'][str(index)] = seconds
+            self._estimates = None
+
+    @contextlib.contextmanager
+    def timing(self, test_id, index=None):
+        start = time.perf_counter()
+        skipped = False
+        try:
+            yield
+        except unittest.SkipTest:
+            # Skipping says nothing about how long the test takes
+            skipped = True
+            raise
+        finally:
+            if not skipped:
+                self.record(test_id, time.perf_counter() - start, index)
+
+    def duration(self, test_id):
+        """The recorded duration of a test, or None"""
+        entry = self.tests.get(test_id)
+        if entry is None:
+            return None
+        if 'duration' in entry:
+            return entry['duration']
+        if entry['cells']:
+            return sum(entry['cells'].values())
+        return None
+
+    def _class_estimates(self):
+        with self.lock:
+            if self._estimates is None:
+                by_class = {}
+                for test_id in self.tests:
+                    duration = self.duration(test_id)
+                    if duration is not None:
+                        by_class.setdefault(_class_id(test_id), []).append(duration)
+                everything = [d for durations in by_class.values() for d in durations]
+                self._estimates = (
+                    {class_id: statistics.median(durations)
+                     for class_id, durations in by_class.items()},
+                    statistics.median(everything) if everything else DEFAULT_ESTIMATE,
+                )
+            return self._estimates
+
+    def estimate(self, test_id):
+        """The expected duration of a test: its recorded duration, or else
+        the median of its class's, or else the median of all tests'"""
+        duration = self.duration(test_id)
+        if duration is not None:
+            return duration
+        by_class, overall = self._class_estimates()
+        return by_class.get(_class_id(test_id), overall)
+
+    def save(self):
+        # Other processes may be saving to the same file
+        with _process.locked(self.path):
+            tests = load_durations(self.path)
+            with self.lock:
+                for test_id, recorded in self.recorded.items():
+                    entry = tests.setdefault(test_id, {'cells': {}})
+                    entry['cells'].update(recorded['cells'])
+                    if 'duration' in recorded:
+                        entry['duration'] = recorded['duration']
+            save_durations(self.path, tests)
+
+
+def _setup_durations():
+    path = os.environ.get(DURATIONS_ENV)
+    if not path:
+        return None
+    durations = Durations.load(path)
+    atexit.register(durations.save)
+    return durations
+
+
+_durations = _process.Active(_setup_durations)
+
+
+def active_durations():
+    """The durations recorded by this run, if ``REPEATED_TEST_DURATIONS`` is
+    set"""
+    return _durations.get()
+
+
+def timing(test_id, index=None):
+    """Records how long a test method or combination takes, if enabled"""
+    durations = active_durations()
+    if durations is None:
+        return contextlib.nullcontext()
+    return durations.timing(test_id, index)
+
+
+def _flatten(suite):
+    for test in suite:
+        if isinstance(test, unittest.TestSuite):
+            yield from _flatten(test)
+        else:
+            yield test
+
+
+def _durations_or_active(durations):
+    if durations is None:
+        durations = active_durations() or Durations()
+    return durations
+
+
+def _total(estimates):
+    return sum(estimate for estimate, _ in estimates)
+
+
+def ordered(suite, durations=None):
+    """Returns the tests of ``suite`` with the slowest first
+
+    Tests stay grouped by module and class, so that module and class fixtures
+    run once: modules and classes are sorted by their total duration, and
+    tests within them by their own.
+    """
+    durations = _durations_or_active(durations)
+    modules = {}
+    for test in _flatten(suite):
+        classes = modules.setdefault(type(test).__module__, {})
+        classes.setdefault(type(test), []).append(
+            (durations.estimate(test.id()), test))
+    new_suite = unittest.TestSuite()
+    for classes in sorted(
+            modules.values(), reverse=True,
+            key=lambda classes: sum(map(_total, classes.values()))):
+        for tests in sorted(classes.values(), key=_total, reverse=True):
+            tests.sort(key=lambda item: item[0], reverse=True)
+            new_suite.addTests(test for _, test in tests)
+    return new_suite
+
+
+def partition(suite, workers, durations=None):
+    """Splits the tests of ``suite`` into ``workers`` suites of about the same
+    total duration, each of them ``ordered``"""
+    durations = _durations_or_active(durations)
+    tests = sorted(
+        ((durations.estimate(test.id()), i, test)
+         for i, test in enumerate(_flatten(suite))),
+        key=lambda item: (-item[0], item[1]))
+    loads = [(0.0, worker) for worker in range(workers)]
+    assigned = [[] for _ in range(workers)]
+    for estimate, _, test in tests:
+        load, worker = heapq.heappop(loads)
+        assigned[worker].append(test)
+        heapq.heappush(loads, (load + estimate, worker))
+    return [ordered(tests, durations) for tests in assigned]
+
+
+def load_tests(loader, tests, pattern):
+    """``load_tests`` protocol hook that runs the module's tests with
+    ``ordered``"""
+    return ordered(tests)
+
+
+def main(argv=None, out=sys.stdout):
+    parser = argparse.ArgumentParser(
+        prog='python -m repeated_test.schedule',
+        description="Splits discovered tests between workers, slowest first, "
+                    "and lists the test ids for each worker")
+    parser.add_argument('--durations', required=True,
+                        help="durations written with " + DURATIONS_ENV)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--worker', type=int,
+                        help="only list the tests of this worker, from 0")
+    parser.add_argument('-s', '--start-directory', default='.')
+    parser.add_argument('-p', '--pattern', default='test*.py')
+    parser.add_argument('-t', '--top-level-directory')
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.worker is not None and not 0 <= args.worker < args.workers:
+        parser.error("--worker must be between 0 and --workers - 1")
+    durations = Durations.load(args.durations)
+    suite = unittest.defaultTestLoader.discover(
+        args.start_directory, args.pattern, args.top_level_directory)
+    for worker, tests in enumerate(partition(suite, args.workers, durations)):
+        if args.worker is not None and worker != args.worker:
+            continue
+        if args.worker is None:
+            total = sum(durations.estimate(test.id()) for test in tests)
+            print(f"# worker {worker}: {tests.countTestCases()} tests, "
+                  f"~{total:.3g}s", file=out)
+        for test in tests:
+            print(test.id(), file=out)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,3 +1,12 @@
 # repeated_test -- A framework for repeating a test over many values
 # Copyright (C) 2011-2022 by Yann Kaiser and contributors. See AUTHORS and
 # COPYING for details.
+
+import unittest
+
+
+def run_for_result(fixture, name):
+    """Runs one test of a test class and returns its result"""
+    tr = unittest.TestResult()
+    fixture(methodName=name).run(tr)
+    return tr
@@ -0,0 +1,91 @@
+# repeated_test -- A framework for repeating a test over many values
+# Copyright (C) 2011-2022 by Yann Kaiser and contributors. See AUTHORS and
+# COPYING for details.
+
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from repeated_test import Fixtures, with_options_matrix, bench
+from repeated_test.tests import run_for_result
+
+
+class BenchTests(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.path = os.path.join(tmpdir.name, "results.json")
+
+    def make_fixtures(self, calls):
+        @with_options_matrix(size=[10, 100])
+        class bench_tests(Fixtures):
+            _bench_min_time = 0.001
+            _bench_repeat = 3
+            _workers = 4
+
+            def _test(self, data, *, size):
+                raise NotImplementedError
+
+            def _bench(self, data, *, size):
+                calls.append(size)
+                sorted(data * size)
+
+            a = [3, 1, 2],
+        return bench_tests
+
+    def test_measure(self):
+        calls = []
+        result = bench.measure(lambda: calls.append(None), warmup=2, min_time=0.001, repeat=4)
+        self.assertEqual(len(result["samples"]), 4)
+        self.assertGreater(result["loops"], 1)
+        self.assertGreaterEqual(len(calls), 2 + result["loops"] * 4)
+        self.assertEqual(result["min"], min(result["samples"]))
+        self.assertLessEqual(result["min"], result["mean"])
+
+    def test_run(self):
+        calls = []
+        bench_tests = self.make_fixtures(calls)
+        benchmark = bench.Benchmark(self.path)
+        with mock.patch.object(bench._benchmark, "value", benchmark):
+            tr = run_for_result(bench_tests, "test_a")
+        self.assertTrue(tr.wasSuccessful(), tr.errors)
+        self.assertEqual(sorted(set(calls)), [10, 100])
+        benchmark.save()
+        results = bench.load_results(self.path)
+        cells = results[bench_tests("test_a").id()]
+        self.assertEqual(cells["0"]["params"], {"size": "10"})
+        self.assertEqual(cells["1"]["params"], {"size": "100"})
+        self.assertEqual(len(cells["1"]["samples"]), 3)
+        self.assertEqual(
+            {key for key in cells["0"]},
+            {"params", "loops", "samples", "mean", "stdev", "min"})
+
+        out = io.StringIO()
+        self.assertEqual(bench.main([self.path], out=out), 0)
+        self.assertIn("test_a[1] (size=100): mean", out.getvalue())
+
+    def test_baseline(self):
+        bench_tests = self.make_fixtures([])
+        test_id = bench_tests("test_a").id()
+        baseline = {test_id: {
+            "0": {"params": {"size": "10"}, "min": 1e-12, "mean": 1e-12},
+            "1": {"params": {"size": "100"}, "min": 1000.0, "mean": 1000.0},
+        }}
+        benchmark = bench.Benchmark(self.path, baseline)
+        with mock.patch.object(bench._benchmark, "value", benchmark):
+            tr = run_for_result(bench_tests, "test_a")
+        (test, message), = tr.failures
+        self.assertEqual(test.params, {"size": 10})
+        self.assertIn("slower than baseline", message)
+        self.assertIn("threshold 10.0%", message)
+
+        benchmark.save()
+        baseline_path = self.path + ".baseline"
+        bench.save_results(baseline_path, baseline)
+        rows = bench.compare(baseline, bench.load_results(self.path))
+        self.assertEqual([(row[1], row[5]) for row in rows], [("0", True), ("1", False)])
+        out = io.StringIO()
+        self.assertEqual(bench.main([self.path, "--baseline", baseline_path], out=out), 1)
+        self.assertIn("REGRESSED", out.getvalue())
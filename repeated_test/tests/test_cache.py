@@ -0,0 +1,116 @@
+# repeated_test -- A framework for repeating a test over many values
+# Copyright (C) 2011-2022 by Yann Kaiser and contributors. See AUTHORS and
+# COPYING for details.
+
+import os
+import sys
+import tempfile
+import unittest
+
+from repeated_test import cache
+
+
+MODULE_SOURCE = '''\
+from repeated_test import Fixtures, with_options_matrix
+
+@with_options_matrix(mode=["a", "b"])
+class cached_fixtures(Fixtures):
+    def _test(self, a, b, *, mode):
+        self.assertEqual(a, b)
+
+    one = 1, 1
+    two = 2, 2
+
+    def test_plain(self):
+        pass
+'''
+
+BASE_SOURCE = '''\
+from repeated_test import Fixtures
+
+class base(Fixtures):
+    def _test(self, value):
+        pass
+
+    one = 1,
+'''
+
+DERIVED_SOURCE = '''\
+class derived(base_module.base):
+    def _test(self, value):
+        pass
+
+    two = 2,
+'''
+
+
+class CollectionCacheTests(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.dir = tmpdir.name
+        self.addCleanup(sys.path.remove, self.dir)
+        sys.path.insert(0, self.dir)
+        self.module_name = 'test_cached_fixtures_' + str(id(self))
+        self.addCleanup(sys.modules.pop, self.module_name, None)
+        self.filename = os.path.join(self.dir, self.module_name + '.py')
+        self.write(MODULE_SOURCE)
+        self.cache_path = os.path.join(self.dir, 'cache.json')
+
+    def write(self, source):
+        with open(self.filename, 'w') as f:
+            f.write(source)
+
+    def test_collect(self):
+        c = cache.CollectionCache(self.cache_path, root=self.dir)
+        ids = c.discover(self.dir)
+        self.assertEqual(
+            sorted(test_id.rsplit('.', 1)[1] for test_id in ids),
+            ['test_one', 'test_plain', 'test_two'])
+        self.assertEqual(c.lookup(self.filename)['dependencies'], {})
+
+    def test_reuse_without_import(self):
+        cache.CollectionCache(self.cache_path).discover(self.dir)
+        sys.modules.pop(self.module_name)
+        ids = cache.CollectionCache(self.cache_path).discover(self.dir)
+        self.assertEqual(len(ids), 3)
+        self.assertNotIn(self.module_name, sys.modules)
+
+    def test_touched_but_unchanged(self):
+        cache.CollectionCache(self.cache_path).discover(self.dir)
+        sys.modules.pop(self.module_name)
+        stat = os.stat(self.filename)
+        os.utime(self.filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        c = cache.CollectionCache(self.cache_path)
+        self.assertIsNotNone(c.lookup(self.filename))
+        self.assertNotIn(self.module_name, sys.modules)
+
+    def test_invalidated_by_change(self):
+        cache.CollectionCache(self.cache_path).discover(self.dir)
+        sys.modules.pop(self.module_name)
+        self.write(MODULE_SOURCE + '    three = 3, 3\n')
+        c = cache.CollectionCache(self.cache_path)
+        self.assertIsNone(c.lookup(self.filename))
+        ids = c.discover(self.dir)
+        self.assertEqual(len(ids), 4)
+        self.assertIn(self.module_name, sys.modules)
+
+    def test_invalidated_by_base_class_change(self):
+        base_name = 'cached_base_' + str(id(self))
+        self.addCleanup(sys.modules.pop, base_name, None)
+        base_filename = os.path.join(self.dir, base_name + '.py')
+        with open(base_filename, 'w') as f:
+            f.write(BASE_SOURCE)
+        self.write(f'import {base_name} as base_module\n\n' + DERIVED_SOURCE)
+        c = cache.CollectionCache(self.cache_path, root=self.dir)
+        self.assertEqual(len(c.discover(self.dir)), 2)
+        self.assertEqual(
+            list(c.lookup(self.filename)['dependencies']),
+            [os.path.realpath(base_filename)])
+        sys.modules.pop(self.module_name)
+        sys.modules.pop(base_name)
+        with open(base_filename, 'a') as f:
+            f.write('    three = 3,\n')
+        c = cache.CollectionCache(self.cache_path, root=self.dir)
+        self.assertIsNone(c.lookup(self.filename))
+        self.assertEqual(len(c.discover(self.dir)), 3)
@@ -0,0 +1,171 @@
+# repeated_test -- A framework for repeating a test over many values
+# Copyright (C) 2011-2022 by Yann Kaiser and contributors. See AUTHORS and
+# COPYING for details.
+
+import importlib
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from repeated_test import Fixtures, with_options_matrix, impact
+from repeated_test.tests import run_for_result
+
+
+HELPERS_SOURCE = '''\
+def double(x):
+    return x * 2
+
+
+def triple(x):
+    return x * 3
+
+
+FACTOR = 1
+'''
+
+DIFF = '''\
+diff --git a/pkg/changed.py b/pkg/changed.py
+index 1111111..2222222 100644
+--- a/pkg/changed.py
++++ b/pkg/changed.py
+@@ -3,2 +3,3 @@ def f():
+-    a
+-    b
++    c
++    d
++    e
+@@ -10,0 +12 @@ def g():
++    inserted
+@@ -20 +22 @@ def h():
+-    one
++    two
+diff --git a/pkg/new.py b/pkg/new.py
+new file mode 100644
+--- /dev/null
++++ b/pkg/new.py
+@@ -0,0 +1 @@
++x = 1
+'''
+
+
+class ImpactTests(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.dir = os.path.realpath(tmpdir.name)
+        self.module_name = 'impact_helpers_' + str(id(self))
+        with open(os.path.join(self.dir, self.module_name + '.py'), 'w') as f:
+            f.write(HELPERS_SOURCE)
+        sys.path.insert(0, self.dir)
+        self.addCleanup(sys.path.remove, self.dir)
+        self.addCleanup(sys.modules.pop, self.module_name, None)
+        self.helpers = importlib.import_module(self.module_name)
+        self.index_path = os.path.join(self.dir, 'impact.json')
+
+    def make_fixtures(self):
+        helpers = self.helpers
+
+        @with_options_matrix(func=["double", "triple"])
+        class impact_tests(Fixtures):
+            def _test(self, value, *, func):
+                self.assertEqual(getattr(helpers, func)(value), value * (2 if func == "double" else 3))
+
+            a = 1,
+            b = 2,
+
+            def test_plain(self):
+                pass
+        return impact_tests
+
+    def record(self, fixtures, names=("test_a", "test_b")):
+        recorder = impact.Recorder(self.index_path, root=self.dir)
+        with mock.patch.object(impact._recorder, 'value', recorder):
+            for name in names:
+                self.assertTrue(run_for_result(fixtures, name).wasSuccessful())
+        recorder.save()
+        return impact.load_index(self.index_path)
+
+    def test_record(self):
+        fixtures = self.make_fixtures()
+        index = self.record(fixtures)
+        functions = [tuple(function) for function in index['functions']]
+        filename = self.module_name + '.py'
+        self.assertEqual(sorted(functions), [(filename, 'double', 1, 2), (filename, 'triple', 5, 6)])
+        cells = index['tests'][fixtures('test_a').id()]
+        self.assertEqual(cells['count'], 2)
+        self.assertEqual(
+            {cell: [functions[i][1] for i in ids] for cell, ids in cells['cells'].items()},
+            {'0': ['double'], '1': ['triple']})
+
+        self.record(fixtures)
+        self.assertEqual(impact.load_index(self.index_path), index)
+
+    def test_record_threads(self):
+        helpers = self.helpers
+        barrier = threading.Barrier(2, timeout=10)
+
+        @with_options_matrix(func=["double", "triple"])
+        class threaded(Fixtures):
+            _workers = 2
+            def _test(self, value, *, func):
+                # Both combinations record at the same time
+                barrier.wait()
+                getattr(helpers, func)(value)
+
+            a = 1,
+
+        index = self.record(threaded, ["test_a"])
+        functions = [tuple(function) for function in index['functions']]
+        cells = index['tests'][threaded('test_a').id()]['cells']
+        self.assertEqual(
+            {cell: [functions[i][1] for i in ids] for cell, ids in cells.items()},
+            {'0': ['double'], '1': ['triple']})
+
+    def test_record_fixture_line(self):
+        source = (
+            "from repeated_test import Fixtures\n"
+            "class labelled(Fixtures):\n"
+            "    _test = lambda self, value: None\n"
+            "    a = 1,\n"
+        )
+        namespace = {}
+        exec(compile(source, os.path.join(self.dir, 'labelled.py'), 'exec'), namespace)
+        index = self.record(namespace['labelled'], ["test_a"])
+        self.assertIn(['labelled.py', '<fixture a>', 4, 4], index['functions'])
+
+    def test_select(self):
+        fixtures = self.make_fixtures()
+        index = self.record(fixtures)
+        filename = self.module_name + '.py'
+        test_a = fixtures('test_a').id()
+
+        selection = impact.Selection(index, {filename: {2}})
+        self.assertEqual(selection.affected_indexes(test_a, 2), [0])
+        self.assertIsNone(selection.affected_indexes(test_a, 3))
+        self.assertIsNone(selection.affected_indexes('unknown', 2))
+        self.assertEqual(len(selection.affected_tests()), 2)
+        self.assertEqual(impact.Selection(index, {filename: {6}}).affected_indexes(test_a, 2), [1])
+        # Module-level changes affect every function of the file
+        self.assertEqual(impact.Selection(index, {filename: {9}}).affected_indexes(test_a, 2), [0, 1])
+        self.assertEqual(impact.Selection(index, {filename: None}).affected_indexes(test_a, 2), [0, 1])
+        self.assertEqual(impact.Selection(index, {'other.py': None}).affected_tests(), [])
+
+        with mock.patch.object(impact._selection, 'value', impact.Selection(index, {filename: {6}})):
+            tr = run_for_result(fixtures, "test_a")
+            self.assertTrue(tr.wasSuccessful())
+            self.assertEqual(tr.skipped, [])
+            with mock.patch.object(fixtures, '_test', lambda self, value, *, func: self.assertNotEqual(func, 'double')):
+                self.assertTrue(run_for_result(fixtures, "test_a").wasSuccessful())
+        with mock.patch.object(impact._selection, 'value', impact.Selection(index, {'other.py': {1}})):
+            tr = run_for_result(fixtures, "test_a")
+            self.assertEqual(tr.skipped[0][1], "Not affected by changes")
+            self.assertEqual(run_for_result(fixtures, "test_plain").skipped, [])
+
+    def test_parse_diff(self):
+        self.assertEqual(impact.parse_diff(DIFF), {
+            'pkg/changed.py': {3, 4, 10, 11, 20},
+            'pkg/new.py': None,
+        })
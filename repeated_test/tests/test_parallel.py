@@ -0,0 +1,180 @@
+# repeated_test -- A framework for repeating a test over many values
+# Copyright (C) 2011-2022 by Yann Kaiser and contributors. See AUTHORS and
+# COPYING for details.
+
+import threading
+import unittest
+
+from repeated_test import Fixtures, options, with_options_matrix, AbortPolicy, parallel
+from repeated_test.tests import run_for_result
+
+
+def make_barrier(parties):
+    return threading.Barrier(parties, timeout=10)
+
+
+class ThreadedCombinationTests(unittest.TestCase):
+    def test_concurrent(self):
+        barrier = make_barrier(4)
+        threads = set()
+
+        @with_options_matrix(n=range(8))
+        class threaded(Fixtures):
+            _workers = 4
+            def _test(self, failing, *, n):
+                threads.add(threading.get_ident())
+                if n < 4:
+                    barrier.wait()
+                self.assertNotIn(n, failing)
+
+            a = {1, 6, 2},
+
+        tr = run_for_result(threaded, "test_a")
+        self.assertEqual(tr.errors, [])
+        self.assertEqual(
+            [test.params["n"] for test, _ in tr.failures],
+            [1, 2, 6])
+        self.assertIn("threaded", tr.failures[0][1])
+        self.assertIn("a = {1, 6, 2},", tr.failures[0][1])
+        self.assertGreater(len(threads), 1)
+
+    def test_nested_subtest(self):
+        def make(workers):
+            @with_options_matrix(n=range(4))
+            class nested(Fixtures):
+                _workers = workers
+                def _test(self, *, n):
+                    for i in range(3):
+                        with self.subTest(i=i):
+                            self.assertLess(n + i, 3)
+                    with self.subTest("skipped"):
+                        self.skipTest("inner skip")
+
+                a = ()
+            return nested
+
+        results = [
+            run_for_result(make(workers), "test_a") for workers in (2, 1)]
+        for tr in results:
+            self.assertEqual(tr.errors, [])
+            self.assertEqual(
+                [dict(test.params) for test, _ in tr.failures],
+                [{"n": 1, "i": 2}, {"n": 2, "i": 1}, {"n": 2, "i": 2},
+                 {"n": 3, "i": 0}, {"n": 3, "i": 1}, {"n": 3, "i": 2}])
+            self.assertEqual(len(tr.skipped), 4)
+        self.assertEqual(
+            *[[test.id() for test, _ in tr.failures] for tr in results])
+
+    def test_abort(self):
+        @with_options_matrix(n=range(20))
+        class threaded(Fixtures):
+            _workers = 2
+            _abort_policy = AbortPolicy(1)
+            def _test(self, *, n):
+                self.fail()
+
+            a = ()
+
+        tr = run_for_result(threaded, "test_a")
+        self.assertGreaterEqual(len(tr.failures), 1)
+        self.assertLess(len(tr.failures), 20)
+        (_, reason), = tr.skipped
+        self.assertIn(f"{20 - len(tr.failures)} of 20 combinations not run", reason)
+
+    def test_options_contextmanager_threads(self):
+        barrier = make_barrier(2)
+        classes = {}
+
+        def define(value):
+            class option_fixtures(Fixtures):
+                def _test(self, *, value):
+                    raise NotImplementedError
+                with options(value=value):
+                    barrier.wait()
+                    a = ()
+                b = ()
+            classes[value] = option_fixtures
+
+        threads = [threading.Thread(target=define, args=(value,)) for value in (1, 2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for value, cls in classes.items():
+            self.assertEqual(cls.a[0].kwargs, {"value": value})
+            self.assertEqual(cls.b, ())
+
+
+class ThreadPoolSuiteTests(unittest.TestCase):
+    def make_fixtures(self, workers, barrier, events):
+        class base(unittest.TestCase):
+            @classmethod
+            def setUpClass(cls):
+                events.append("setUpClass")
+
+            @classmethod
+            def tearDownClass(cls):
+                events.append("tearDownClass")
+
+        class threaded(Fixtures):
+            _TestCase = base
+            _workers = workers
+
+            def _test(self, fail):
+                barrier.wait()
+                events.append(self._testMethodName)
+                if fail:
+                    self.fail("example failure")
+
+            a = True,
+            b = False,
+            c = True,
+
+            def test_plain(self):
+                events.append("test_plain")
+                barrier.wait()
+        return threaded
+
+    def test_parallelize(self):
+        barrier = make_barrier(4)
+        events = []
+        threaded = self.make_fixtures(4, barrier, events)
+        suite = unittest.defaultTestLoader.loadTestsFromTestCase(threaded)
+        suite = parallel.parallelize(unittest.TestSuite([suite]))
+        tr = unittest.TestResult()
+        suite.run(tr)
+
+        self.assertEqual(tr.testsRun, 4)
+        self.assertEqual(tr.errors, [])
+        self.assertEqual(
+            [test._testMethodName for test, _ in tr.failures],
+            ["test_a", "test_c"])
+        self.assertEqual(events[0], "setUpClass")
+        self.assertEqual(events[-1], "tearDownClass")
+        self.assertEqual(
+            sorted(events[1:-1]),
+            ["test_a", "test_b", "test_c", "test_plain"])
+
+    def test_recorded_order(self):
+        barrier = make_barrier(1)
+        threaded = self.make_fixtures(2, barrier, [])
+        suite = unittest.defaultTestLoader.loadTestsFromTestCase(threaded)
+        suite = parallel.parallelize(suite)
+        self.assertIsInstance(next(iter(suite)), parallel.ThreadPoolSuite)
+        started = []
+        class result(unittest.TestResult):
+            def startTest(self, test):
+                started.append(test._testMethodName)
+                super().startTest(test)
+        suite.run(result())
+        self.assertEqual(started, ["test_a", "test_b", "test_c", "test_plain"])
+
+    def test_not_parallel(self):
+        class plain(Fixtures):
+            def _test(self):
+                pass
+            a = ()
+            b = ()
+        suite = unittest.defaultTestLoader.loadTestsFromTestCase(plain)
+        suite = parallel.parallelize(suite)
+        self.assertEqual([type(test) for test in suite], [plain, plain])
@@ -2,12 +2,21 @@
 # Copyright (C) 2011-2022 by Yann Kaiser and contributors. See AUTHORS and
 # COPYING for details.
 
+import concurrent.futures
 import io
+import itertools
+import os
+import subprocess
 import sys
+import tempfile
+import textwrap
+import threading
 import unittest
 
 
-from repeated_test import Fixtures, WithTestClass, tup, core, options, skip_option, with_options, with_options_matrix, NamedAlternative, evaluated
+from repeated_test import Fixtures, WithTestClass, tup, core, _abort, _blob, _matrix, _resources, AbortPolicy, options, skip_option, with_options, with_options_matrix, NamedAlternative, evaluated, lazy, blob, explore
+from repeated_test import _explore as explore_module
+from repeated_test.tests import run_for_result
 
 
 skip_noprepare = unittest.skipIf(
@@ -276,6 +285,244 @@ class RepeatedTestTests(unittest.TestCase):
         self.run_test(commutativity_inverse, "test_mul", raises=AssertionError, failures_contain=["commutativity", "pair=(3, 7)", "pair=(4, 6)"])
         self.run_test(commutativity_inverse, "test_div")
 
+    def make_indexed_matrix(self):
+        @with_options_matrix(
+            x=[0, 1, 2],
+            y=["a", "b"],
+        )
+        class indexed(Fixtures):
+            def _test(self, failing, *, x, y):
+                self.assertNotIn((x, y), failing)
+
+            none_failing = (),
+            one_failing = {(2, "a")},
+            with options(y="b"):
+                fixed_y = {(1, "b")},
+        return indexed
+
+    def run_selected(self, fixture, name, **kwargs):
+        with self.subTest(name):
+            suite = unittest.defaultTestLoader.loadTestsFromName(name, fixture)
+            (tc,) = suite
+            self.assertEqual(tc._testMethodName, name)
+            self.run_test_without_subtest(lambda methodName: tc, name, **kwargs)
+
+    def test_options_matrix_generator(self):
+        seen = []
+        @with_options_matrix(x=(i for i in range(3)))
+        class generated(Fixtures):
+            def _test(self, *, x):
+                seen.append(x)
+
+            a = ()
+            b = ()
+
+        self.run_test(generated, "test_a")
+        self.run_test(generated, "test_b")
+        self.assertEqual(seen, [0, 1, 2, 0, 1, 2])
+
+    def test_options_matrix_index(self):
+        indexed = self.make_indexed_matrix()
+        self.run_test(indexed, "test_none_failing")
+        self.run_test(indexed, "test_one_failing", raises=AssertionError, failures_contain=["[4] (x=2, y='a')"])
+        self.run_test(indexed, "test_fixed_y", raises=AssertionError, failures_contain=["[1] (x=1)"])
+
+    def test_options_matrix_select(self):
+        indexed = self.make_indexed_matrix()
+        self.run_selected(indexed, "test_one_failing[3]")
+        self.run_selected(indexed, "test_one_failing[4]", raises=AssertionError, failures_contain=["[4] (x=2, y='a')"])
+        self.run_selected(indexed, "test_one_failing[y=b]")
+        self.run_selected(indexed, "test_one_failing[x=2]", raises=AssertionError, failures_contain=["[4] (x=2, y='a')"])
+        self.run_selected(indexed, "test_one_failing[x=2,y=a]", raises=AssertionError, failures_contain=["[4] (x=2, y='a')"])
+        self.run_selected(indexed, "test_one_failing[y='b']")
+        self.run_selected(indexed, "test_fixed_y[0]")
+        self.run_selected(indexed, "test_one_failing[6]", raises=ValueError, errors_contain=["out of range"])
+        self.run_selected(indexed, "test_one_failing[y=c]", raises=ValueError, errors_contain=["No value for option 'y'"])
+        self.run_selected(indexed, "test_fixed_y[y=b]", raises=ValueError, errors_contain=["Unknown options"])
+        self.assertFalse(hasattr(indexed, "test_missing[1]"))
+        self.assertFalse(hasattr(indexed, "test_x[1]"))
+        self.assertNotIn("test_one_failing[3]", unittest.defaultTestLoader.getTestCaseNames(indexed))
+        self.run_test_without_subtest(indexed, "test_one_failing[4]", raises=AssertionError, failures_contain=["[4] (x=2, y='a')"])
+        self.assertFalse(hasattr(indexed("test_none_failing"), "test_missing[1]"))
+
+    def test_options_matrix_index_decoding(self):
+        axes = [("a", range(3)), ("b", "xy"), ("c", [None, True, False, 0])]
+        product = itertools.product(*(values for _, values in axes))
+        for index, values in enumerate(product):
+            self.assertEqual(_matrix.combination_at(axes, index), dict(zip("abc", values)))
+        self.assertEqual(_matrix.select_indexes(axes, "b=y,c=True"), [5, 13, 21])
+        huge = [("a", range(10**12)), ("b", range(10**12))]
+        self.assertEqual(_matrix.combination_at(huge, 10**12 * 5 + 7), {"a": 5, "b": 7})
+
+    def test_options_matrix_select_environ(self):
+        environ = {_matrix.SELECT_ENV: "other[1] mod.cls.test_a[x=1,y=2] test_b[3]"}
+        self.assertEqual(_matrix.selector_from_environ("mod.cls.test_a", environ), "x=1,y=2")
+        self.assertEqual(_matrix.selector_from_environ("mod.other_cls.test_b", environ), "3")
+        self.assertIsNone(_matrix.selector_from_environ("mod.cls.test_c", environ))
+        # Dotted values can't go in a method name, but can be selected here
+        dotted = {_matrix.SELECT_ENV: "cls.test_a[x=1.5]"}
+        self.assertEqual(_matrix.selector_from_environ("mod.cls.test_a", dotted), "x=1.5")
+        self.assertEqual(_matrix.select_indexes([("x", [1, 1.5])], "x=1.5"), [1])
+        with self.assertRaises(ValueError):
+            _matrix.selector_from_environ("mod.cls.test_a", {_matrix.SELECT_ENV: "test_a"})
+
+    def make_abort_fixtures(self, policy):
+        @with_options_matrix(n=range(6))
+        class abort_tests(Fixtures):
+            _abort_policy = policy
+            def _test(self, failing, *, n):
+                self.assertNotIn(n, failing)
+
+            all_failing = range(6),
+            some_failing = {1, 3, 4},
+            none_failing = (),
+        return abort_tests
+
+    def test_abort_max_failures(self):
+        abort_tests = self.make_abort_fixtures(AbortPolicy(2))
+        tr = run_for_result(abort_tests, "test_all_failing")
+        self.assertEqual(len(tr.failures), 2)
+        (_, reason), = tr.skipped
+        self.assertIn("Aborted after 2 failures in 2 runs", reason)
+        self.assertIn("4 of 6 combinations not run: 2-5", reason)
+        tr = run_for_result(abort_tests, "test_some_failing")
+        self.assertEqual(len(tr.failures), 2)
+        self.assertIn("2 of 6 combinations not run: 4-5", tr.skipped[0][1])
+        tr = run_for_result(abort_tests, "test_none_failing")
+        self.assertEqual(tr.failures, [])
+        self.assertEqual(tr.skipped, [])
+
+    def test_abort_failure_rate(self):
+        abort_tests = self.make_abort_fixtures(AbortPolicy(max_failure_rate=0.4, min_runs=3))
+        tr = run_for_result(abort_tests, "test_some_failing")
+        self.assertEqual(len(tr.failures), 2)
+        self.assertIn("2 of 6 combinations not run: 4-5", tr.skipped[0][1])
+
+    def test_abort_class_scope(self):
+        abort_tests = self.make_abort_fixtures(AbortPolicy(3, scope="class"))
+        tr = run_for_result(abort_tests, "test_some_failing")
+        self.assertEqual(len(tr.failures), 3)
+        self.assertIn("1 of 6 combinations not run: 5", tr.skipped[0][1])
+        tr = run_for_result(abort_tests, "test_none_failing")
+        self.assertEqual(len(tr.failures), 0)
+        self.assertIn("6 of 6 combinations not run: 0-5", tr.skipped[0][1])
+
+        single = self.make_abort_fixtures(AbortPolicy(1, scope="class")).with_options_matrix(n=[0])
+        tr = run_for_result(single, "test_all_failing")
+        self.assertEqual(len(tr.failures), 1)
+        tr = run_for_result(single, "test_none_failing")
+        self.assertIn("1 of 1 combinations not run: 0", tr.skipped[0][1])
+
+    def test_abort_policy_parse(self):
+        self.assertEqual(AbortPolicy.parse("1"), AbortPolicy(1))
+        self.assertEqual(
+            AbortPolicy.parse("max_failure_rate=0.5, min_runs=4, scope=class"),
+            AbortPolicy(max_failure_rate=0.5, min_runs=4, scope="class"))
+        self.assertEqual(repr(AbortPolicy(3, scope="class")), "AbortPolicy(max_failures=3, scope='class')")
+        with self.assertRaises(ValueError):
+            AbortPolicy.parse("max_failures")
+        with self.assertRaises(ValueError):
+            AbortPolicy.parse("maximum=3")
+        with self.assertRaises(ValueError):
+            AbortPolicy(scope="module")
+        self.assertEqual(_abort.describe_indexes([1, 2, 3, 5, 7, 8], limit=2), "1-3, 5, ...")
+
+    def test_abort_environ(self):
+        abort_tests = self.make_abort_fixtures(None)
+        tc = abort_tests(methodName="test_all_failing")
+        self.assertEqual(_abort.policy_for(tc, {}), AbortPolicy())
+        self.assertEqual(_abort.policy_for(tc, {_abort.ABORT_ENV: "2"}), AbortPolicy(2))
+
+    def test_resources(self):
+        events = []
+        def connection(*, backend):
+            events.append(("open", backend))
+            yield f"connection to {backend}"
+            events.append(("close", backend))
+
+        @with_options_matrix(backend=["pg", "sqlite"], size=[1, 2, 3])
+        class resource_tests(Fixtures):
+            _resources = {"db": connection, "unused": lambda: events.append("unused")}
+            def _test(self, expected_size, *, backend, size, db):
+                self.assertEqual(db, f"connection to {backend}")
+                self.assertEqual(size, expected_size)
+
+            a = 1,
+            b = 2,
+            with options(db="given"):
+                overridden = 3,
+
+        suite = unittest.TestSuite([resource_tests("test_a"), resource_tests("test_b")])
+        tr = unittest.TestResult()
+        suite.run(tr)
+        self.assertEqual(len(tr.failures), 8, tr.failures)
+        self.assertEqual(tr.errors, [])
+        self.assertEqual(events, [("open", "pg"), ("open", "sqlite"), ("close", "pg"), ("close", "sqlite")])
+
+        del events[:]
+        self.run_test(resource_tests, "test_overridden", raises=AssertionError, failures_contain=["'given' != 'connection to pg'"])
+        self.assertEqual(events, [])
+
+    def test_resource_pool(self):
+        events = []
+        def factory(*, key):
+            events.append(("open", key))
+            yield key
+            events.append(("close", key))
+
+        pool = _resources.ResourcePool(maxsize=2)
+        for key in [1, 2, 1, 3, 1]:
+            with pool.checkout("res", factory, {"key": key, "other": object()}):
+                pass
+        self.assertEqual(events, [("open", 1), ("open", 2), ("open", 3), ("close", 2)])
+
+        with pool.checkout("res", factory, {"key": 1}) as first:
+            with pool.checkout("res", factory, {"key": 1}) as second:
+                self.assertEqual((first, second), (1, 1))
+        self.assertEqual(events[-2:], [("open", 1), ("close", 3)])
+
+        del events[:]
+        with pool.checkout("res", factory, {"key": 3}):
+            pool.close()
+            self.assertEqual(events, [("open", 3), ("close", 1), ("close", 1)])
+        self.assertEqual(events[-1], ("close", 3))
+        with self.assertRaises(RuntimeError):
+            with pool.checkout("res", factory, {"key": 3}):
+                raise NotImplementedError
+
+    def test_resource_pool_unhashable(self):
+        events = []
+        def factory(*, key):
+            events.append(("open", key))
+            yield key
+            events.append(("close", key))
+
+        pool = _resources.ResourcePool()
+        for _ in range(2):
+            with pool.checkout("res", factory, {"key": [1]}) as resource:
+                self.assertEqual(resource, [1])
+        self.assertEqual(events, [("open", [1]), ("close", [1])] * 2)
+
+    def test_resource_pool_threads(self):
+        created = []
+        barrier = threading.Barrier(4)
+        def factory():
+            created.append(None)
+            return len(created)
+
+        pool = _resources.ResourcePool()
+        def worker():
+            with pool.checkout("res", factory, {}) as resource:
+                barrier.wait()
+                return resource
+
+        with concurrent.futures.ThreadPoolExecutor(4) as executor:
+            results = list(executor.map(lambda _: worker(), range(4)))
+        self.assertEqual(sorted(results), [1, 2, 3, 4])
+        with pool.checkout("res", factory, {}):
+            pass
+        self.assertEqual(len(created), 4)
+
     def test_options_matrix_inheritance(self):
         @with_options_matrix(
             suffix1=["x", "x"],
@@ -364,6 +611,68 @@ class RepeatedTestTests(unittest.TestCase):
                 failures_contain=['@tup("one", "params")'],
             )
 
+    def test_script_top_level(self):
+        script = textwrap.dedent("""
+            import unittest
+            from repeated_test import Fixtures
+
+            class script_tests(Fixtures):
+                def _test(self, a, b):
+                    self.assertEqual(a, b)
+
+                a = 1, 1
+
+            unittest.main()
+        """)
+        package_dir = os.path.dirname(os.path.dirname(core.__file__))
+        env = {**os.environ, "PYTHONPATH": package_dir}
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "script.py")
+            with open(path, "w") as f:
+                f.write(script)
+            for command in [[path], ["-c", script]]:
+                process = subprocess.run(
+                    [sys.executable, *command],
+                    capture_output=True, text=True, env=env)
+                self.assertEqual(process.returncode, 0, process.stderr)
+                self.assertIn("Ran 1 test", process.stderr)
+
+    def test_optional_features_not_imported(self):
+        script = textwrap.dedent("""
+            import sys
+            import unittest
+            from repeated_test import Fixtures, with_options_matrix
+
+            @with_options_matrix(n=range(2))
+            class plain(Fixtures):
+                def _test(self, *, n):
+                    pass
+
+                a = ()
+
+            plain("test_a").run(unittest.TestResult())
+            print(" ".join(sorted(sys.modules)))
+        """)
+        package_dir = os.path.dirname(os.path.dirname(core.__file__))
+        env = {
+            key: value for key, value in os.environ.items()
+            if not key.startswith("REPEATED_TEST_")}
+        env["PYTHONPATH"] = package_dir
+        process = subprocess.run(
+            [sys.executable, "-c", script],
+            capture_output=True, text=True, env=env)
+        self.assertEqual(process.returncode, 0, process.stderr)
+        modules = process.stdout.split()
+        for name in ["bench", "impact", "parallel", "schedule"]:
+            self.assertNotIn("repeated_test." + name, modules)
+
+        from repeated_test import bench, impact, schedule
+        self.assertEqual(core._feature_environ, {
+            "bench": (bench.BENCH_ENV,),
+            "impact": (impact.RECORD_ENV, impact.SELECT_ENV),
+            "schedule": (schedule.DURATIONS_ENV,),
+        })
+
     def test_relocate_frame_chevrons(self):
         f = core._raise_at_custom_line("mymodule.py", 123, "<module>")
         self.assertEqual(f.__name__, 'module')
@@ -442,6 +751,211 @@ class RepeatedTestTests(unittest.TestCase):
         ])
         self.run_test(evaluated_tests, "test_inline_evaluation")
 
+    def test_lazy(self):
+        calls = []
+        def expensive():
+            calls.append(None)
+            return 3, 1, 2
+
+        shared = lazy(expensive)
+
+        @with_options_matrix(offset=[0, 1, 2])
+        class lazy_tests(Fixtures):
+            def _test(self, total, *terms, offset, extra=0):
+                self.assertEqual(total + offset, sum(terms) + offset + extra)
+
+            whole = shared
+            part = shared, 0
+            with_options = lazy(lambda: (4, 1, 2, options(extra=1)))
+
+            @lazy
+            def decorated():
+                return 5, 2, 3
+
+            failing = lazy(lambda: (0, 1))
+
+            @lazy
+            def raising():
+                raise ValueError("example error")
+
+        self.assertEqual(calls, [])
+        self.run_test(lazy_tests, "test_whole")
+        self.assertEqual(len(calls), 1)
+        self.run_test(lazy_tests, "test_part")
+        self.assertEqual(len(calls), 2)
+
+        kept = shared.resolve()
+        self.assertEqual(len(calls), 3)
+        self.run_test(lazy_tests, "test_whole")
+        self.run_test(lazy_tests, "test_part")
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(kept.values, (3, 1, 2))
+
+        self.run_test(lazy_tests, "test_with_options")
+        self.run_test(lazy_tests, "test_decorated")
+        self.run_test(lazy_tests, "test_failing", raises=AssertionError, failures_contain=[
+            "failing = lazy(lambda: (0, 1))",
+        ])
+        self.run_test(lazy_tests, "test_raising", raises=ValueError, errors_contain=[
+            "lazy_tests", "example error",
+        ])
+        self.assertEqual(repr(shared), f"repeated_test.lazy({expensive!r})")
+
+    def test_blob(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            paths = {}
+            for name, contents in [("small", b"abc"), ("large", b"x" * 100000), ("empty", b"")]:
+                paths[name] = os.path.join(tmpdir, name)
+                with open(paths[name], "wb") as f:
+                    f.write(contents)
+            views = []
+
+            @with_options_matrix(n=range(3), sample=[blob(paths["small"]), blob(paths["large"])])
+            class blob_tests(Fixtures):
+                def _test(self, data, expected_length, *, n, sample):
+                    views.append(data)
+                    self.assertIsInstance(data, memoryview)
+                    self.assertIsInstance(sample, memoryview)
+                    self.assertTrue(data.readonly)
+                    self.assertEqual(len(data), expected_length)
+                    self.assertEqual(bytes(data[:3]), b"abc"[:expected_length])
+
+                small = blob(paths["small"]), 3
+                lone = blob(paths["small"])
+                empty = blob(paths["empty"]), 0
+                large = blob(paths["large"]), 3
+                missing = blob(os.path.join(tmpdir, "missing")), 0
+
+                @evaluated
+                def evaluated_view(self, *, n, sample):
+                    self.assertIsInstance(sample, memoryview)
+                    return blob(paths["small"]), 3
+
+            self.run_test(blob_tests, "test_small")
+            self.assertEqual(len(views), 6)
+            self.assertTrue(all(view is views[0] for view in views))
+            self.run_test(blob_tests, "test_empty")
+            self.run_test(blob_tests, "test_evaluated_view")
+            self.run_test(blob_tests, "test_large", raises=AssertionError, failures_contain=[
+                "large = blob(paths[\"large\"]), 3",
+            ])
+            self.run_test(blob_tests, "test_lone", raises=TypeError)
+            self.run_test(blob_tests, "test_missing", raises=FileNotFoundError, errors_contain=[
+                "missing = blob(os.path.join(tmpdir, \"missing\")), 0",
+            ])
+            del views[:]
+            _blob._registry.close()
+
+        self.assertEqual(blob("sample.bin"), blob("sample.bin"))
+        self.assertEqual(blob("sample.bin").full_path, os.path.join(os.path.dirname(os.path.abspath(__file__)), "sample.bin"))
+        self.assertEqual(repr(blob("sample.bin")), "repeated_test.blob('sample.bin')")
+
+    def test_blob_registry(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            paths = []
+            for i in range(3):
+                paths.append(os.path.join(tmpdir, str(i)))
+                with open(paths[-1], "wb") as f:
+                    f.write(bytes([i]) * 10)
+            registry = _blob.MappingRegistry(max_idle=1)
+            with registry.opened(paths[0]) as first:
+                with registry.opened(paths[0]) as second:
+                    self.assertIs(first, second)
+                with registry.opened(paths[1]) as other:
+                    self.assertEqual(bytes(other), b"\1" * 10)
+                self.assertEqual(registry.mapped_count(), 2)
+                with registry.opened(paths[2]):
+                    pass
+                self.assertEqual(registry.mapped_count(), 2)
+                self.assertEqual(bytes(first), b"\0" * 10)
+            with registry.opened(paths[0]) as view:
+                kept = view[:5]
+            registry.close()
+            self.assertEqual(registry.mapped_count(), 0)
+            self.assertEqual(bytes(kept), b"\0" * 5)
+            with self.assertRaises(ValueError):
+                bytes(view)
+
+            with open(paths[0], "wb") as f:
+                f.write(b"changed")
+            with registry.opened(paths[0]) as view:
+                self.assertEqual(bytes(view), b"changed")
+            del kept
+
+    def test_explore(self):
+        tried = []
+
+        @with_options_matrix(size=explore(range(1, 100000)), threads=explore(range(1, 65)), mode=["a", "b"])
+        class explored(Fixtures):
+            def _test(self, limit, *, size, threads, mode):
+                tried.append((size, threads, mode))
+                self.assertFalse(size >= limit and threads >= 3 and mode == "b")
+
+            failing = 5000,
+            passing = 10 ** 6,
+
+        tr = unittest.TestResult()
+        explored("test_failing").run(tr)
+        (test, trace), = tr.failures
+        self.assertEqual(test.params, {"size": 5000, "threads": 3, "mode": "b"})
+        self.assertIn("failing = 5000,", trace)
+        self.assertLessEqual(len(tried), 2 * explore_module.DEFAULT_BUDGET)
+        index = test._message
+        first_run = list(tried)
+
+        del tried[:]
+        explored("test_failing").run(unittest.TestResult())
+        self.assertEqual(tried, first_run)
+
+        del tried[:]
+        tr = unittest.TestResult()
+        unittest.defaultTestLoader.loadTestsFromName(f"test_failing[{index}]", explored).run(tr)
+        self.assertEqual(tried, [(5000, 3, "b")])
+        (test, _), = tr.failures
+        self.assertEqual(test.params, {"size": 5000, "threads": 3, "mode": "b"})
+
+        del tried[:]
+        tr = unittest.TestResult()
+        explored("test_passing").run(tr)
+        self.assertTrue(tr.wasSuccessful())
+        self.assertEqual(len(tried), explore_module.DEFAULT_BUDGET)
+        self.assertEqual(len(set(tried)), len(tried))
+        self.assertIn((1, 1, "a"), tried)
+        self.assertIn((99999, 64, "b"), tried)
+
+        @with_options_matrix(size=explore(range(10)), other=explore(iter([1, 2])))
+        class small(Fixtures):
+            _explore_budget = 20
+            def _test(self, *, size, other):
+                tried.append((size, other))
+
+            a = ()
+
+        del tried[:]
+        small("test_a").run(unittest.TestResult())
+        self.assertEqual(len(tried), 20)
+
+        small._explore_budget = 5
+        del tried[:]
+        small("test_a").run(unittest.TestResult())
+        self.assertEqual(len(tried), 5)
+        self.assertEqual(repr(explore(range(3))), "repeated_test.explore(range(0, 3))")
+
+        @with_options_matrix(size=explore(range(10 ** 6)))
+        class inner(Fixtures):
+            def _test(self, limit, *, size):
+                for i in range(3):
+                    with self.subTest(i=i):
+                        self.assertLess(size + i, limit)
+
+            a = 5000,
+
+        tr = unittest.TestResult()
+        inner("test_a").run(tr)
+        self.assertEqual(
+            [dict(test.params) for test, _ in tr.failures],
+            [{"size": 4998, "i": 2}])
+
     @skip_noprepare
     def test_dup(self):
         with self.assertRaises(ValueError):
@@ -0,0 +1,208 @@
+# repeated_test -- A framework for repeating a test over many values
+# Copyright (C) 2011-2022 by Yann Kaiser and contributors. See AUTHORS and
+# COPYING for details.
+
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import textwrap
+import unittest
+from unittest import mock
+
+from repeated_test import Fixtures, with_options_matrix, parallel, schedule
+
+
+class ScheduleTests(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.tmpdir = tmpdir.name
+        self.path = os.path.join(tmpdir.name, "durations.json")
+
+    def make_fixtures(self, events=None):
+        @with_options_matrix(n=range(3))
+        class schedule_tests(Fixtures):
+            _workers = 1
+            def _test(self, *, n):
+                if events is not None:
+                    events.append(self._testMethodName)
+                if self._testMethodName == "test_skipped":
+                    self.skipTest("example skip")
+
+            fast = ()
+            slow = ()
+            medium = ()
+            skipped = ()
+        return schedule_tests
+
+    def ids(self, suite):
+        return [test._testMethodName for test in schedule._flatten(suite)]
+
+    def test_record(self):
+        schedule_tests = self.make_fixtures()
+        durations = schedule.Durations.load(self.path)
+        with mock.patch.object(schedule._durations, "value", durations):
+            schedule_tests("test_fast").run(unittest.TestResult())
+            schedule_tests("test_skipped").run(unittest.TestResult())
+            schedule_tests("test_medium").test_medium("1")
+        durations.save()
+
+        tests = schedule.load_durations(self.path)
+        fast = tests[schedule_tests("test_fast").id()]
+        self.assertEqual(set(fast["cells"]), {"0", "1", "2"})
+        self.assertGreaterEqual(fast["duration"], sum(fast["cells"].values()))
+        self.assertEqual(tests[schedule_tests("test_skipped").id()]["cells"], {})
+        medium = tests[schedule_tests("test_medium").id()]
+        self.assertEqual(set(medium), {"cells"})
+        self.assertEqual(set(medium["cells"]), {"1"})
+
+        durations = schedule.Durations.load(self.path)
+        durations.record(schedule_tests("test_slow").id(), 2.0)
+        durations.save()
+        tests = schedule.load_durations(self.path)
+        self.assertEqual(tests[schedule_tests("test_slow").id()]["duration"], 2.0)
+        self.assertEqual(tests[schedule_tests("test_fast").id()], fast)
+
+    def test_save_from_processes(self):
+        script = textwrap.dedent("""\
+            import sys
+            from repeated_test import schedule
+
+            path, worker = sys.argv[1:]
+            for i in range(20):
+                durations = schedule.Durations.load(path)
+                durations.record(f"mod.cls.test_{worker}_{i}", 1.0)
+                durations.save()
+        """)
+        package_dir = os.path.dirname(os.path.dirname(schedule.__file__))
+        env = {**os.environ, "PYTHONPATH": package_dir}
+        processes = [
+            subprocess.Popen(
+                [sys.executable, "-c", script, self.path, str(worker)],
+                env=env)
+            for worker in range(4)
+        ]
+        for process in processes:
+            self.assertEqual(process.wait(), 0)
+        self.assertEqual(len(schedule.load_durations(self.path)), 80)
+
+    def test_estimate(self):
+        durations = schedule.Durations()
+        self.assertEqual(durations.estimate("mod.cls.test_a"), schedule.DEFAULT_ESTIMATE)
+        durations.record("mod.cls.test_a", 1.0)
+        durations.record("mod.cls.test_b", 3.0)
+        durations.record("mod.cls.test_c", 4.0)
+        durations.record("mod.other.test_a", 10.0)
+        durations.record("mod.other.test_b", 0.5, index=0)
+        durations.record("mod.other.test_b", 0.25, index=1)
+        self.assertEqual(durations.estimate("mod.cls.test_a"), 1.0)
+        self.assertEqual(durations.estimate("mod.other.test_b"), 0.75)
+        self.assertEqual(durations.estimate("mod.cls.test_new"), 3.0)
+        self.assertEqual(durations.estimate("mod.new.test_new"), 3.0)
+        durations.record("mod.cls.test_d", 5.0)
+        self.assertEqual(durations.estimate("mod.cls.test_new"), 3.5)
+
+    def durations_for(self, fixtures, **seconds):
+        durations = schedule.Durations()
+        for name, duration in seconds.items():
+            durations.record(fixtures(name).id(), duration)
+        return durations
+
+    def test_ordered(self):
+        schedule_tests = self.make_fixtures()
+        class other_tests(unittest.TestCase):
+            def test_x(self):
+                pass
+
+            def test_y(self):
+                pass
+        durations = self.durations_for(
+            schedule_tests, test_fast=0.1, test_slow=1.0, test_medium=0.5, test_skipped=0.0)
+        durations.record(other_tests("test_y").id(), 5.0)
+        suite = unittest.TestSuite([
+            unittest.defaultTestLoader.loadTestsFromTestCase(schedule_tests),
+            unittest.defaultTestLoader.loadTestsFromTestCase(other_tests),
+        ])
+        suite = schedule.ordered(suite, durations)
+        self.assertEqual(
+            [(type(test), test._testMethodName) for test in suite],
+            [(other_tests, "test_x"), (other_tests, "test_y"),
+             (schedule_tests, "test_slow"), (schedule_tests, "test_medium"),
+             (schedule_tests, "test_fast"), (schedule_tests, "test_skipped")])
+
+        with mock.patch.object(schedule._durations, "value", durations):
+            suite = schedule.load_tests(
+                None, unittest.defaultTestLoader.loadTestsFromTestCase(schedule_tests), None)
+        self.assertEqual(self.ids(suite), ["test_slow", "test_medium", "test_fast", "test_skipped"])
+
+    def test_partition(self):
+        names = ["test_a", "test_b", "test_c", "test_d", "test_e"]
+        partitioned = type("partitioned", (unittest.TestCase,), {
+            name: lambda self: None for name in names})
+        durations = self.durations_for(
+            partitioned, test_a=3.0, test_b=5.0, test_c=3.0, test_d=4.0, test_e=3.0)
+        suite = unittest.defaultTestLoader.loadTestsFromTestCase(partitioned)
+        workers = schedule.partition(suite, 2, durations)
+        self.assertEqual(
+            [self.ids(tests) for tests in workers],
+            [["test_b", "test_c"], ["test_d", "test_a", "test_e"]])
+        workers = schedule.partition(suite, 3, durations)
+        self.assertEqual(sorted(tests.countTestCases() for tests in workers), [1, 2, 2])
+
+    def test_thread_pool_starts_slowest_first(self):
+        events = []
+        schedule_tests = self.make_fixtures(events)
+        durations = self.durations_for(
+            schedule_tests, test_fast=0.1, test_slow=1.0, test_medium=0.5, test_skipped=0.0)
+        suite = parallel.ThreadPoolSuite(
+            unittest.defaultTestLoader.loadTestsFromTestCase(schedule_tests), workers=1)
+        started = []
+        class result(unittest.TestResult):
+            def startTest(self, test):
+                started.append(test._testMethodName)
+                super().startTest(test)
+        with mock.patch.object(schedule._durations, "value", durations):
+            suite.run(result())
+        self.assertEqual(
+            events[::3], ["test_slow", "test_medium", "test_fast", "test_skipped"])
+        self.assertEqual(started, ["test_fast", "test_medium", "test_skipped", "test_slow"])
+
+    def test_main(self):
+        with open(os.path.join(self.tmpdir, "test_schedule_sample.py"), "w") as f:
+            f.write(textwrap.dedent("""
+                import unittest
+
+                class sample(unittest.TestCase):
+                    def test_a(self):
+                        pass
+
+                    def test_b(self):
+                        pass
+
+                    def test_c(self):
+                        pass
+            """))
+        self.addCleanup(sys.modules.pop, "test_schedule_sample", None)
+        self.addCleanup(lambda: self.tmpdir in sys.path and sys.path.remove(self.tmpdir))
+        schedule.save_durations(self.path, {
+            "test_schedule_sample.sample.test_a": {"duration": 2.0, "cells": {}},
+            "test_schedule_sample.sample.test_b": {"duration": 1.5, "cells": {}},
+        })
+        args = ["--durations", self.path, "--workers", "2", "-s", self.tmpdir, "-t", self.tmpdir]
+        out = io.StringIO()
+        self.assertEqual(schedule.main(args, out=out), 0)
+        self.assertEqual(out.getvalue().splitlines(), [
+            "# worker 0: 1 tests, ~2s",
+            "test_schedule_sample.sample.test_a",
+            "# worker 1: 2 tests, ~3.25s",
+            "test_schedule_sample.sample.test_c",
+            "test_schedule_sample.sample.test_b",
+        ])
+        out = io.StringIO()
+        self.assertEqual(schedule.main(args + ["--worker", "1"], out=out), 0)
+        self.assertEqual(out.getvalue().splitlines(), [
+            "test_schedule_sample.sample.test_c",
+            "test_schedule_sample.sample.test_b",
+        ])
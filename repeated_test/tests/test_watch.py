@@ -0,0 +1,328 @@
+# repeated_test -- A framework for repeating a test over many values
+# Copyright (C) 2011-2022 by Yann Kaiser and contributors. See AUTHORS and
+# COPYING for details.
+
+import functools
+import io
+import os
+import sys
+import tempfile
+import textwrap
+import unittest
+from unittest import mock
+
+from repeated_test import Fixtures, NamedAlternative, evaluated, explore, options, with_options_matrix, watch
+from repeated_test.tests import run_for_result
+
+
+LIB_SOURCE = """
+def double(x):
+    return x * 2
+"""
+
+TEST_SOURCE = """
+import unittest
+from repeated_test import Fixtures, NamedAlternative, with_options_matrix
+import watch_sample_lib
+
+def scaled(value, factor):
+    return value * factor
+
+@with_options_matrix(factor=[1, 2])
+class sample(Fixtures):
+    def _test(self, value, expected, *, factor):
+        self.assertEqual(scaled(watch_sample_lib.double(value), factor), expected * factor)
+
+    a = 1, 2
+    b = 2, 4
+    c = 3, 6
+
+class plain(unittest.TestCase):
+    def test_x(self):
+        pass
+
+    def test_y(self):
+        pass
+"""
+
+
+class RecordingRunner:
+    def __init__(self):
+        self.ran = []
+
+    def run(self, suite):
+        ran = []
+        class result(unittest.TestResult):
+            def startTest(self, test):
+                ran.append(test.id().rpartition(".")[2])
+                super().startTest(test)
+        tr = result()
+        suite.run(tr)
+        self.ran.append(ran)
+        return tr
+
+
+class DescribeTests(unittest.TestCase):
+    def make_fixtures(self, factors, c_value=6):
+        @with_options_matrix(factor=factors, other=["x", "y"])
+        class sample(Fixtures):
+            def _test(self, value, expected, *, factor, other):
+                raise NotImplementedError
+
+            a = 1, 2
+            c = 3, c_value
+
+            def test_plain(self):
+                pass
+        return sample
+
+    def changes(self, before, after):
+        return watch.changed_tests(
+            {"sample": watch.describe_class(before)},
+            {"sample": watch.describe_class(after)})
+
+    def test_unchanged(self):
+        self.assertEqual(
+            self.changes(self.make_fixtures([1, 2]), self.make_fixtures([1, 2])), [])
+
+    def test_changed_value(self):
+        self.assertEqual(
+            self.changes(self.make_fixtures([1, 2]), self.make_fixtures([1, 2], c_value=7)),
+            ["sample.test_c"])
+
+    def test_new_axis_value(self):
+        self.assertEqual(
+            self.changes(self.make_fixtures([1, 2]), self.make_fixtures([1, 3, 2])),
+            ["sample.test_a[2]", "sample.test_a[3]", "sample.test_c[2]", "sample.test_c[3]"])
+
+    def test_moved_combination(self):
+        before = [["x", ["1", "2"]], ["y", ["a", "b"]]]
+        self.assertEqual(watch.moved_combination(before, before, 3), 3)
+        after = [["x", ["0", "1", "2"]], ["y", ["b"]]]
+        self.assertEqual(watch.moved_combination(before, after, 3), 2)
+        self.assertIsNone(watch.moved_combination(before, after, 2))
+        self.assertIsNone(watch.moved_combination(before, after, 4))
+        self.assertIsNone(watch.moved_combination(before, [["x", ["1", "2"]]], 0))
+        self.assertIsNone(watch.moved_combination("explored", "explored", 0))
+
+    def test_explored_axis(self):
+        def make(values):
+            @with_options_matrix(size=explore(values), other=["x"])
+            class sample(Fixtures):
+                def _test(self, *, size, other):
+                    raise NotImplementedError
+
+                a = ()
+            return sample
+        self.assertEqual(self.changes(make(range(10 ** 9)), make(range(10 ** 9))), [])
+        self.assertEqual(self.changes(make(range(10 ** 9)), make(range(10 ** 10))), ["sample.test_a"])
+
+    def test_generator_axis(self):
+        @with_options_matrix(x=(i for i in range(3)))
+        class sample(Fixtures):
+            def _test(self, *, x):
+                pass
+
+            a = ()
+        self.assertEqual(len(watch.describe_class(sample)["fixtures"]["a"]["axes"][0][1]), 3)
+        self.assertTrue(run_for_result(sample, "test_a").wasSuccessful())
+
+    def test_function_details(self):
+        def make(c=3, d=5, offset=0, scale=1, base=10):
+            @with_options_matrix(b=[functools.partial(int, base=base)])
+            class sample(Fixtures):
+                def _test(self, a, *, b, c=c, d=d):
+                    raise NotImplementedError(offset)
+
+                a = functools.partial(max, scale),
+            return sample
+        self.assertEqual(self.changes(make(), make()), [])
+        # A positional default, a keyword-only default, a closure cell and
+        # partial args in a fixture
+        for kwargs in [{"c": 4}, {"d": 6}, {"offset": 1}, {"scale": 2}]:
+            with self.subTest(**kwargs):
+                self.assertEqual(self.changes(make(), make(**kwargs)), ["sample.test_a"])
+        # Partial keywords in a matrix axis
+        self.assertEqual(self.changes(make(), make(base=16)), ["sample.test_a[0]"])
+
+    def test_named_alternative(self):
+        def make(value):
+            @with_options_matrix(n=[NamedAlternative("n", value)])
+            class sample(Fixtures):
+                def _test(self, *, n):
+                    raise NotImplementedError
+
+                a = ()
+            return sample
+        self.assertEqual(self.changes(make(3), make(3)), [])
+        self.assertEqual(self.changes(make(3), make(5)), ["sample.test_a[0]"])
+
+    def test_new_class(self):
+        self.assertEqual(
+            watch.changed_tests({}, {"sample": watch.describe_class(self.make_fixtures([1]))}),
+            ["sample.test_a", "sample.test_c", "sample.test_plain"])
+
+
+class FingerprintTests(unittest.TestCase):
+    def make_fixtures(self, expected):
+        class fixtures(Fixtures):
+            def _test(self, value):
+                self.assertEqual(value, expected)
+
+            @evaluated
+            def evaluated_value(self):
+                return 1,
+
+            with options(opt=1):
+                value = 1,
+        return fixtures
+
+    def test_stable(self):
+        self.assertEqual(
+            watch.fingerprint(self.make_fixtures(1).evaluated_value),
+            watch.fingerprint(self.make_fixtures(1).evaluated_value))
+
+    def test_changes(self):
+        self.assertNotEqual(watch.fingerprint((1, options(a=1))),
+                            watch.fingerprint((1, options(a=2))))
+        self.assertNotEqual(watch.fingerprint(lambda: 1),
+                            watch.fingerprint(lambda: 2))
+        self.assertEqual(watch.fingerprint(lambda: 1),
+                         watch.fingerprint(lambda: 1))
+
+
+class WatcherTests(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.tmpdir = tmpdir.name
+        self.mtime = 1_000_000_000
+        for name in ["watch_sample_lib", "test_watch_sample", "test_watch_sample2"]:
+            self.addCleanup(sys.modules.pop, name, None)
+        self.addCleanup(lambda: self.tmpdir in sys.path and sys.path.remove(self.tmpdir))
+        patcher = mock.patch.object(sys, "dont_write_bytecode", True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.write("watch_sample_lib.py", LIB_SOURCE)
+        self.write("test_watch_sample.py", TEST_SOURCE)
+        self.runner = RecordingRunner()
+        self.watcher = watch.Watcher(self.tmpdir, runner=self.runner, stream=io.StringIO())
+
+    def write(self, name, source):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, "w") as f:
+            f.write(textwrap.dedent(source))
+        # Make sure the change is seen even with coarse timestamps
+        self.mtime += 10
+        os.utime(path, (self.mtime, self.mtime))
+
+    def edit(self, name, old, new):
+        with open(os.path.join(self.tmpdir, name)) as f:
+            source = f.read()
+        self.assertIn(old, source)
+        self.write(name, source.replace(old, new))
+
+    def test_watch(self):
+        tr = self.watcher.start()
+        self.assertTrue(tr.wasSuccessful())
+        self.assertEqual(self.runner.ran[-1], ["test_x", "test_y", "test_a", "test_b", "test_c"])
+        self.assertIsNone(self.watcher.poll())
+
+        self.edit("test_watch_sample.py", "    a = 1, 2", "\n    a = 1, 2")
+        self.edit("test_watch_sample.py", "    c = 3, 6", "    c = 3, 7")
+        self.edit("test_watch_sample.py", "    def test_y(self):\n        pass", "    def test_y(self):\n        self.assertTrue(True)")
+        tr = self.watcher.poll()
+        self.assertEqual(self.runner.ran[-1], ["test_c", "test_y"])
+        self.assertEqual(len(tr.failures), 2)
+        self.assertEqual(
+            self.watcher.failed,
+            {"test_watch_sample.sample.test_c[0]", "test_watch_sample.sample.test_c[1]"})
+
+        self.edit("test_watch_sample.py", "factor=[1, 2]", "factor=[1, 2, 3]")
+        tr = self.watcher.poll()
+        self.assertEqual(
+            self.runner.ran[-1],
+            ["test_a[2]", "test_b[2]", "test_c[2]", "test_c[0]", "test_c[1]"])
+        self.assertEqual(len(tr.failures), 3)
+        self.assertEqual(len(self.watcher.failed), 3)
+
+        self.edit("test_watch_sample.py", "    c = 3, 7", "    c = 3, 6")
+        tr = self.watcher.poll()
+        self.assertEqual(self.runner.ran[-1], ["test_c"])
+        self.assertTrue(tr.wasSuccessful())
+        self.assertEqual(self.watcher.failed, set())
+
+        self.edit("watch_sample_lib.py", "x * 2", "x + x")
+        tr = self.watcher.poll()
+        self.assertEqual(self.runner.ran[-1], ["test_x", "test_y", "test_a", "test_b", "test_c"])
+
+        self.write("test_watch_sample2.py", """
+            import unittest
+
+            class other(unittest.TestCase):
+                def test_new(self):
+                    self.fail()
+        """)
+        os.utime(self.tmpdir, (self.mtime, self.mtime))
+        tr = self.watcher.poll()
+        self.assertEqual(self.runner.ran[-1], ["test_new"])
+        self.assertEqual(self.watcher.failed, {"test_watch_sample2.other.test_new"})
+
+        self.edit("test_watch_sample2.py", "def test_new(self):", "def test_renamed(self):")
+        tr = self.watcher.poll()
+        self.assertEqual(self.runner.ran[-1], ["test_renamed"])
+        self.assertEqual(self.watcher.failed, {"test_watch_sample2.other.test_renamed"})
+
+    def test_failed_combinations_moved(self):
+        self.watcher.start()
+        self.edit("test_watch_sample.py", "    c = 3, 6", "    c = 3, 7")
+        self.watcher.poll()
+        self.assertEqual(
+            self.watcher.failed,
+            {"test_watch_sample.sample.test_c[0]", "test_watch_sample.sample.test_c[1]"})
+
+        self.edit("test_watch_sample.py", "factor=[1, 2]", "factor=[2]")
+        tr = self.watcher.poll()
+        self.assertEqual(self.runner.ran[-1], ["test_c[0]"])
+        self.assertEqual(len(tr.failures), 1)
+        self.assertEqual(self.watcher.failed, {"test_watch_sample.sample.test_c[0]"})
+
+        self.edit("test_watch_sample.py", "factor=[2]", "factor=[3, 2]")
+        tr = self.watcher.poll()
+        self.assertEqual(self.runner.ran[-1], ["test_a[0]", "test_b[0]", "test_c[0]", "test_c[1]"])
+        self.assertEqual(
+            self.watcher.failed,
+            {"test_watch_sample.sample.test_c[0]", "test_watch_sample.sample.test_c[1]"})
+
+    def test_defaults_and_named_alternatives(self):
+        self.edit("test_watch_sample.py", "*, factor):", "*, factor, extra=0):")
+        self.edit("test_watch_sample.py", "factor=[1, 2]", "factor=[1, NamedAlternative('two', 2)]")
+        self.watcher.start()
+
+        self.edit("test_watch_sample.py", "extra=0", "extra=1")
+        self.watcher.poll()
+        self.assertEqual(self.runner.ran[-1], ["test_a", "test_b", "test_c"])
+
+        self.edit("test_watch_sample.py", "NamedAlternative('two', 2)", "NamedAlternative('two', 3)")
+        self.watcher.poll()
+        self.assertEqual(self.runner.ran[-1], ["test_a[1]", "test_b[1]", "test_c[1]"])
+
+    def test_module_code(self):
+        self.watcher.start()
+        self.edit("test_watch_sample.py", "def scaled(value, factor):", "# Comment\ndef scaled(value, factor):")
+        self.assertIsNone(self.watcher.poll())
+        self.edit("test_watch_sample.py", "return value * factor", "return value * factor + 1")
+        tr = self.watcher.poll()
+        self.assertEqual(self.runner.ran[-1], ["test_x", "test_y", "test_a", "test_b", "test_c"])
+        self.assertEqual(len(tr.failures), 6)
+
+    def test_broken_module(self):
+        self.edit("test_watch_sample.py", "    a = 1, 2", "    a = (")
+        self.watcher.start()
+        self.assertEqual(self.runner.ran, [])
+        self.assertIn("Failed to import test_watch_sample", self.watcher.stream.getvalue())
+        self.assertIsNone(self.watcher.poll())
+
+        self.edit("test_watch_sample.py", "    a = (", "    a = 1, 2")
+        self.watcher.poll()
+        self.assertEqual(self.runner.ran[-1], ["test_x", "test_y", "test_a", "test_b", "test_c"])
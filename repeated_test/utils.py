@@ -2,6 +2,7 @@
 # Copyright (C) 2011-2022 by Yann Kaiser and contributors. See AUTHORS and
 # COPYING for details.
 
+import threading
 from functools import partial
 
 def _tup(args, func):
@@ -10,11 +11,17 @@ def _tup(args, func):
 def tup(*args):
     return partial(_tup, args)
 
+class _ActiveOptions(threading.local):
+    # Class bodies may run in several threads at once, each with its own
+    # stack of ``with options(...)`` blocks
+    def __init__(self):
+        self.stack = []
+
 class options:
     def __init__(self, **kwargs) -> None:
         self.kwargs = kwargs
 
-    __ACTIVE_OPTIONS = []
+    __ACTIVE_OPTIONS = _ActiveOptions()
 
     @classmethod
     def split_into_args_kwargs(cls, args_and_options):
@@ -29,13 +36,13 @@ class options:
 
     @classmethod
     def get_active_options(cls):
-        return tuple(cls.__ACTIVE_OPTIONS)
+        return tuple(cls.__ACTIVE_OPTIONS.stack)
 
     def __enter__(self):
-        type(self).__ACTIVE_OPTIONS.append(self)
+        type(self).__ACTIVE_OPTIONS.stack.append(self)
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        type(self).__ACTIVE_OPTIONS.pop()
+        type(self).__ACTIVE_OPTIONS.stack.pop()
 
 class _SkipOption:
     def __repr__(self):
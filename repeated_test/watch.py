@@ -0,0 +1,586 @@
+# repeated_test -- A framework for repeating a test over many values
+# Copyright (C) 2011-2022 by Yann Kaiser and contributors. See AUTHORS and
+# COPYING for details.
+
+"""Re-running tests as their source changes, without restarting.
+
+``python -m repeated_test.watch`` runs the tests it discovers, then keeps
+their modules loaded and polls the modification time of every source file
+under the top-level directory. Changed modules are reloaded, along with the
+modules that use them, and each reloaded test class is compared with its
+previous version:
+
+- Fixtures whose value changed are re-run, as are test methods whose code
+  changed.
+- Combinations that use a value added to an options matrix are re-run, not
+  the fixture's other combinations.
+- Every test of a class is re-run when anything else about it changed, such
+  as its ``_test`` function or ``setUp``, or when a module it depends on did.
+- Every test of a module is re-run when its code outside of its test classes
+  changed, such as a helper function or a constant.
+- Fixtures that only moved to another line aren't re-run.
+
+Tests and combinations that failed in the previous run are re-run too, until
+they pass. Failed combinations are followed through changes to their matrix
+axes, and forgotten if their values were removed.
+"""
+
+import argparse
+import ast
+import functools
+import hashlib
+import importlib
+import itertools
+import os
+import re
+import sys
+import time
+import tokenize
+import traceback
+import types
+import unittest
+
+from repeated_test import _explore, _matrix, _process
+from repeated_test.cache import find_modules
+from repeated_test.core import FixturesMeta, OPTIONS_MATRIX_KEY, _fixture_lines
+from repeated_test.utils import NamedAlternative, options
+
+
+POLL_INTERVAL = 0.5
+
+_internal_modules = {'builtins', 'unittest.case', 'repeated_test.core'}
+_address_re = re.compile(r' at 0x[0-9a-fA-F]+')
+
+
+def _code_fingerprint(code):
+    return (
+        code.co_code,
+        code.co_names,
+        tuple(
+            _code_fingerprint(const) if isinstance(const, types.CodeType)
+            else const
+            for const in code.co_consts
+        ),
+    )
+
+
+def _closure_contents(func):
+    contents = []
+    for cell in getattr(func, '__closure__', None) or ():
+        try:
+            contents.append(cell.cell_contents)
+        except ValueError: # not set yet
+            contents.append(None)
+    return tuple(contents)
+
+
+def _fingerprint_parts(value, seen=frozenset()):
+    if id(value) in seen:
+        # Such as a function that refers to itself through its closure
+        return 'recursive'
+    parts = functools.partial(_fingerprint_parts, seen=seen | {id(value)})
+    if isinstance(value, (tuple, list)):
+        return type(value).__name__, tuple(parts(item) for item in value)
+    if isinstance(value, dict):
+        return 'dict', tuple(
+            (parts(key), parts(item)) for key, item in value.items())
+    if isinstance(value, options):
+        return 'options', parts(tuple(sorted(value.kwargs.items())))
+    if isinstance(value, NamedAlternative):
+        return 'NamedAlternative', value.name, parts(value.value)
+    if isinstance(value, functools.partial):
+        return (
+            'partial', parts(value.func), parts(value.args),
+            parts(tuple(sorted(value.keywords.items()))),
+        )
+    code = getattr(value, '__code__', None)
+    if isinstance(code, types.CodeType):
+        return (
+            'code', _code_fingerprint(code),
+            parts(getattr(value, '__defaults__', None)),
+            parts(getattr(value, '__kwdefaults__', None)),
+            parts(_closure_contents(value)),
+        )
+    for attribute in ('__func__', 'func'):
+        func = getattr(value, attribute, None)
+        if func is not None and func is not value:
+            return type(value).__name__, parts(func)
+    return _address_re.sub('', repr(value))
+
+
+def fingerprint(value):
+    """Returns a short digest that changes when ``value`` does.
+
+    Functions are compared by their code, defaults and closure contents
+    rather than by identity, and memory addresses are dropped from reprs, so that the same source gives the same
+    fingerprint across processes and module reloads.
+    """
+    digest = hashlib.sha1(repr(_fingerprint_parts(value)).encode())
+    return digest.hexdigest()[:16]
+
+
+def _class_attributes(cls, excluded):
+    attributes = {}
+    for klass in reversed(cls.__mro__):
+        if klass.__module__ in _internal_modules:
+            continue
+        for name, value in vars(klass).items():
+            if not name.startswith('__') and name not in excluded:
+                attributes[name] = fingerprint(value)
+    return fingerprint(tuple(sorted(attributes.items())))
+
+
+def _fixture_axes(cls, value):
+    _, kwargs = options.split_into_args_kwargs(value)
+    axes = _matrix.matrix_axes(getattr(cls, OPTIONS_MATRIX_KEY), kwargs)
+    if _explore.is_explored(axes):
+        # Explored fixtures are re-run as a whole
+        return fingerprint(tuple(axes))
+    return [
+        [key, [fingerprint(item) for item in values]]
+        for key, values in axes
+    ]
+
+
+def describe_class(cls, loader=unittest.defaultTestLoader):
+    """Describes a test class so that changes can be told apart: its test
+    methods, its fixtures and the values of the matrix axes they use, and a
+    fingerprint of everything else"""
+    fixtures = {}
+    if isinstance(cls, FixturesMeta):
+        for name, line in _fixture_lines(cls).items():
+            value = getattr(cls, name)
+            fixtures[name] = {
+                'line': list(line),
+                'value': fingerprint(value),
+                'axes': _fixture_axes(cls, value),
+            }
+    generated = {'test_' + name for name in fixtures}
+    methods = {
+        name: fingerprint(getattr(cls, name))
+        for name in loader.getTestCaseNames(cls)
+        if name not in generated
+    }
+    excluded = {
+        *fixtures, *methods, *generated,
+        OPTIONS_MATRIX_KEY, '_repeated_test__lines',
+    }
+    return {
+        'class': _class_attributes(cls, excluded),
+        'methods': methods,
+        'fixtures': fixtures,
+    }
+
+
+def describe_module(module, loader=unittest.defaultTestLoader):
+    """Describes the test classes defined at the top level of a module"""
+    return {
+        name: describe_class(value, loader)
+        for name, value in vars(module).items()
+        if isinstance(value, type)
+        and issubclass(value, unittest.TestCase)
+        and value.__module__ == module.__name__
+        and value.__qualname__ == name
+    }
+
+
+def describe_module_code(module, class_names):
+    """Returns a fingerprint of the top-level code of a module, leaving out
+    the given classes, or None if its source can't be read
+
+    Comments and line numbers are left out too.
+    """
+    try:
+        with tokenize.open(module.__file__) as f:
+            tree = ast.parse(f.read())
+    except (AttributeError, TypeError, OSError, SyntaxError, ValueError):
+        return None
+    return fingerprint(tuple(
+        ast.dump(node) for node in tree.body
+        if not (isinstance(node, ast.ClassDef) and node.name in class_names)
+    ))
+
+
+def _new_combinations(before, after):
+    """Lists the indexes of the combinations that use a new axis value, or
+    None if the axes themselves changed"""
+    if isinstance(before, str) or isinstance(after, str):
+        return [] if before == after else None
+    if [key for key, _ in before] != [key for key, _ in after]:
+        return None
+    axes = []
+    for (_, old_values), (_, new_values) in zip(before, after):
+        old_values = set(old_values)
+        axes.append((
+            range(len(new_values)),
+            [i for i, value in enumerate(new_values) if value not in old_values],
+        ))
+    sizes = [(None, values) for values, _ in axes]
+    indexes = set()
+    for axis, (_, new_digits) in enumerate(axes):
+        ranges = [values for values, _ in axes]
+        ranges[axis] = new_digits
+        indexes.update(
+            _matrix.combination_index(sizes, digits)
+            for digits in itertools.product(*ranges))
+    return sorted(indexes)
+
+
+def changed_tests(before, after):
+    """Compares two ``describe_module`` results, listing the tests to re-run
+    as names relative to the module, such as ``MyFixtures.test_a`` or
+    ``MyFixtures.test_a[3]`` for a single combination"""
+    names = []
+    for class_name, description in after.items():
+        previous = before.get(class_name)
+        fixture_tests = [
+            'test_' + fixture for fixture in description['fixtures']]
+        if previous is None or previous['class'] != description['class']:
+            names.extend(
+                f'{class_name}.{name}'
+                for name in [*fixture_tests, *description['methods']])
+            continue
+        for fixture, fixture_description in description['fixtures'].items():
+            name = f'{class_name}.test_{fixture}'
+            previous_fixture = previous['fixtures'].get(fixture)
+            if (
+                previous_fixture is None
+                or previous_fixture['value'] != fixture_description['value']
+            ):
+                names.append(name)
+                continue
+            indexes = _new_combinations(
+                previous_fixture['axes'], fixture_description['axes'])
+            if indexes is None:
+                names.append(name)
+            else:
+                names.extend(f'{name}[{index}]' for index in indexes)
+        names.extend(
+            f'{class_name}.{method}'
+            for method, method_fingerprint in description['methods'].items()
+            if previous['methods'].get(method) != method_fingerprint
+        )
+    return names
+
+
+def moved_combination(before, after, index):
+    """Finds the index a combination has after its fixture's axes changed
+    from ``before`` to ``after``, or None if it no longer exists"""
+    if (
+        isinstance(before, str) or isinstance(after, str)
+        or [key for key, _ in before] != [key for key, _ in after]
+        or index >= _matrix.combination_count(before)
+    ):
+        return None
+    combination = _matrix.combination_at(before, index)
+    digits = []
+    for key, values in after:
+        if combination[key] not in values:
+            return None
+        digits.append(values.index(combination[key]))
+    return _matrix.combination_index(after, digits)
+
+
+def _method_name(name):
+    match = _matrix.selected_name_re.match(name.rpartition('.')[2])
+    if match is None:
+        return name
+    return name[:-len(match.group(0))] + match.group(1)
+
+
+def _covers(name, other):
+    """Tells whether running ``name`` runs the test named ``other``"""
+    return (
+        other == name
+        or _method_name(other) == name
+        or other.startswith(name + '.')
+    )
+
+
+def _failed_names(result):
+    """Lists the names of the tests and combinations that failed in result"""
+    names = []
+    tests = [
+        *(test for test, _ in [*result.failures, *result.errors]),
+        *result.unexpectedSuccesses,
+    ]
+    for test in tests:
+        test, index = getattr(test, 'test_case', test), getattr(test, '_message', None)
+        if not isinstance(test, unittest.TestCase) or not hasattr(test, '_testMethodName'):
+            continue
+        name = test.id()
+        if isinstance(index, int) and name == _method_name(name):
+            name = f'{name}[{index}]'
+        names.append(name)
+    return names
+
+
+def _module_of(value):
+    if isinstance(value, types.ModuleType):
+        return value.__name__
+    if isinstance(value, (type, types.FunctionType)):
+        return value.__module__
+    return None
+
+
+def _refers_to(module, module_names):
+    """Tells whether a module holds any of the given modules, or classes or
+    functions from them"""
+    return any(
+        _module_of(value) in module_names for value in vars(module).values())
+
+
+def _exists(name):
+    """Tells whether a test name still refers to a test method"""
+    parts = name.split('.')
+    for i in range(len(parts) - 1, 0, -1):
+        obj = sys.modules.get('.'.join(parts[:i]))
+        if obj is None:
+            continue
+        try:
+            for part in parts[i:]:
+                obj = getattr(obj, part)
+        except AttributeError:
+            return False
+        return callable(obj)
+    return False
+
+
+class Watcher:
+    """Keeps tests loaded, re-running those affected by source changes"""
+
+    def __init__(self, start_dir='.', pattern='test*.py', top_level_dir=None,
+                 runner=None, stream=sys.stderr):
+        self.start_dir = os.path.abspath(start_dir)
+        self.pattern = pattern
+        self.top_level_dir = os.path.abspath(top_level_dir or start_dir)
+        self.loader = unittest.TestLoader()
+        self.runner = runner or unittest.TextTestRunner(stream)
+        self.stream = stream
+        self.test_modules = set()
+        self.descriptions = {}
+        self.code = {}
+        self.mtimes = {}
+        self.directories = {}
+        self.broken = {}
+        self.failed = set()
+
+    def _mtime(self, path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _source_modules(self):
+        modules = {}
+        for name, module in list(sys.modules.items()):
+            filename = getattr(module, '__file__', None)
+            if not filename or not filename.endswith('.py'):
+                continue
+            filename = _process.project_file(filename, self.top_level_dir)
+            if filename is not None:
+                modules[name] = filename
+        return modules
+
+    def _find_test_modules(self):
+        found = []
+        directories = {self.start_dir}
+        for module_name, filename in find_modules(
+                self.start_dir, self.pattern, self.top_level_dir):
+            directories.add(os.path.dirname(filename))
+            if (
+                module_name not in self.test_modules
+                and self.broken.get(module_name) != (filename, self._mtime(filename))
+            ):
+                found.append((module_name, filename))
+        self.directories = {path: self._mtime(path) for path in directories}
+        if found:
+            importlib.invalidate_caches()
+        return found
+
+    def _import(self, modules):
+        imported = []
+        for module_name, filename in modules:
+            try:
+                module = importlib.import_module(module_name)
+            except Exception:
+                self._report_error(f"Failed to import {module_name}")
+                # Tried again once the file changes
+                self.broken[module_name] = filename, self._mtime(filename)
+                continue
+            self.broken.pop(module_name, None)
+            self.test_modules.add(module_name)
+            self._describe(module)
+            imported.append(module_name)
+        return imported
+
+    def _describe(self, module):
+        description = self.descriptions[module.__name__] = describe_module(
+            module, self.loader)
+        self.code[module.__name__] = describe_module_code(module, description)
+
+    def _move_failed(self, module_name, before, after):
+        """Renumbers the failed combinations of a module's fixtures"""
+        failed = set()
+        for name in self.failed:
+            match = None
+            if name.startswith(module_name + '.'):
+                class_name, _, method = name[len(module_name) + 1:].rpartition('.')
+                match = _matrix.selected_name_re.match(method)
+            if match is None or not match.group(2).isdigit():
+                failed.add(name)
+                continue
+            fixture = match.group(1)[5:]
+            try:
+                axes = [
+                    description[class_name]['fixtures'][fixture]['axes']
+                    for description in (before, after)
+                ]
+            except KeyError:
+                continue
+            index = moved_combination(*axes, int(match.group(2)))
+            if index is not None:
+                failed.add(f'{module_name}.{class_name}.{match.group(1)}[{index}]')
+        self.failed = failed
+
+    def _snapshot(self):
+        self.mtimes = {
+            name: self._mtime(filename)
+            for name, filename in self._source_modules().items()
+        }
+
+    def _report_error(self, message):
+        print(message, file=self.stream)
+        traceback.print_exc(file=self.stream)
+
+    def start(self):
+        """Imports the test modules and runs all of their tests"""
+        if self.top_level_dir not in sys.path:
+            sys.path.insert(0, self.top_level_dir)
+        module_names = self._import(self._find_test_modules())
+        self._snapshot()
+        return self.run(module_names)
+
+    def changed_modules(self):
+        """Lists the loaded modules whose source file changed"""
+        changed = []
+        for name, filename in self._source_modules().items():
+            mtime = self._mtime(filename)
+            if name not in self.mtimes:
+                # Imported since, such as by a test
+                self.mtimes[name] = mtime
+            elif mtime != self.mtimes[name]:
+                changed.append(name)
+        return changed
+
+    def _dependents(self, changed):
+        """Adds the loaded modules that refer to the changed ones"""
+        changed = set(changed)
+        modules = self._source_modules()
+        while True:
+            dependents = {
+                name for name in modules
+                if name not in changed
+                and _refers_to(sys.modules[name], changed)
+            }
+            if not dependents:
+                break
+            changed |= dependents
+        # sys.modules is mostly in import order, which reloads dependencies
+        # before the modules that use them
+        return [name for name in modules if name in changed]
+
+    def poll(self):
+        """Reloads changed modules and re-runs the affected tests
+
+        Returns the test result, or None if nothing changed.
+        """
+        new_modules = []
+        if any(self._mtime(path) != mtime
+               for path, mtime in self.directories.items()) or any(
+                self._mtime(filename) != mtime
+                for filename, mtime in self.broken.values()):
+            new_modules = self._find_test_modules()
+        changed = self.changed_modules()
+        if not changed and not new_modules:
+            return None
+        names = []
+        reloaded = self._dependents(changed)
+        for module_name in reloaded:
+            module = sys.modules[module_name]
+            # Tests can't be compared to tell if a module they use changed
+            compare = module_name in changed and not _refers_to(
+                module, set(reloaded) - {module_name})
+            try:
+                importlib.reload(module)
+            except Exception:
+                self._report_error(f"Failed to reload {module_name}")
+                continue
+            if module_name in self.test_modules:
+                before = self.descriptions[module_name]
+                code = self.code[module_name]
+                self._describe(module)
+                self._move_failed(
+                    module_name, before, self.descriptions[module_name])
+                if (
+                    compare and code is not None
+                    and code == self.code[module_name]
+                ):
+                    names.extend(
+                        f'{module_name}.{name}' for name in changed_tests(
+                            before, self.descriptions[module_name]))
+                else:
+                    names.append(module_name)
+        names.extend(self._import(new_modules))
+        self._snapshot()
+        return self.run(names)
+
+    def run(self, names):
+        """Runs the named tests along with the ones that failed last time"""
+        self.failed = {name for name in self.failed if _exists(name)}
+        names = list(dict.fromkeys([*names, *sorted(self.failed)]))
+        names = [
+            name for name in names
+            if not any(other != name and _covers(other, name) for other in names)
+        ]
+        if not names:
+            return None
+        result = self.runner.run(self.loader.loadTestsFromNames(names))
+        self.failed = {
+            name for name in self.failed
+            if not any(_covers(ran, name) for ran in names)
+        }
+        self.failed.update(_failed_names(result))
+        return result
+
+    def watch(self, interval=POLL_INTERVAL):
+        self.start()
+        while True:
+            time.sleep(interval)
+            self.poll()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m repeated_test.watch',
+        description="Runs tests, then re-runs those affected by each change "
+                    "to their source")
+    parser.add_argument('-s', '--start-directory', default='.')
+    parser.add_argument('-p', '--pattern', default='test*.py')
+    parser.add_argument('-t', '--top-level-directory')
+    parser.add_argument('-v', '--verbose', action='store_const', const=2,
+                        dest='verbosity', default=1)
+    parser.add_argument('--interval', type=float, default=POLL_INTERVAL,
+                        help="seconds between checks for changes")
+    args = parser.parse_args(argv)
+    watcher = Watcher(
+        args.start_directory, args.pattern, args.top_level_directory,
+        unittest.TextTestRunner(verbosity=args.verbosity))
+    try:
+        watcher.watch(args.interval)
+    except KeyboardInterrupt:
+        return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())